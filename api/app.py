@@ -3,23 +3,41 @@
 SUNO Downloader Pro - Backend API with Stripe Integration
 """
 
-from flask import Flask, request, jsonify, redirect, send_file
+from flask import Flask, request, jsonify, redirect, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 import stripe
 import os
 import json
 import time
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 import secrets
 import sys
+import base64
+import csv
+import io
+import hashlib
+import zipfile
+import sqlite3
+from functools import wraps
+from urllib.parse import quote
 import bcrypt
 import mysql.connector
 from mysql.connector import Error
 
-# Add workers directory to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'workers'))
-from suno_downloader import SUNODownloader
+# Worker output (must match the worker's DOWNLOAD_DIR)
+DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR', '/Users/Morpheous/vltrndataroom/hitbot-agency/downloads')
+
+# Workers directory (shared modules; the downloader itself is imported lazily, see load_downloader_class)
+WORKERS_DIR = os.path.join(os.path.dirname(__file__), '..', 'workers')
+sys.path.insert(0, WORKERS_DIR)
+from structured_log import get_logger, bind_log_context, reset_log_context
+from signed_urls import build_signed_url, verify_signed_path
+from sampling_profiler import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS
+
+log = get_logger('api')
 
 app = Flask(__name__)
 CORS(app)
@@ -35,20 +53,554 @@ DB_CONFIG = {
 
 def get_db_connection():
     """Create and return a database connection"""
+    start = time.perf_counter()
     try:
         connection = mysql.connector.connect(**DB_CONFIG)
+        observe_histogram('hikeyz_db_connect_seconds', (), time.perf_counter() - start)
         return connection
     except Error as e:
-        print(f"Database connection error: {e}")
+        inc_counter('hikeyz_db_connect_errors_total')
+        log.error(f"Database connection error: {e}")
+        return None
+
+# Operator endpoints (all-user exports, cache flushes) require
+# "Authorization: Bearer <ADMIN_API_TOKEN>"; unset, they refuse every request
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')
+
+def admin_authorized():
+    """True if the request carries the admin API token"""
+    header = request.headers.get('Authorization', '').encode('utf-8')
+    return bool(ADMIN_API_TOKEN) and secrets.compare_digest(header, f"Bearer {ADMIN_API_TOKEN}".encode('utf-8'))
+
+# ==================== METRICS ====================
+
+# Prometheus text exposition at /metrics. Each thread records into its own
+# shard without locking; /metrics merges the shards when scraped. Values are
+# per process, so with several gunicorn workers each one reports its own.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # If set, /metrics requires "Authorization: Bearer <token>"
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_HELP = {
+    'hikeyz_http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'hikeyz_http_request_duration_seconds': ('histogram', 'HTTP request latency by route, method and status'),
+    'hikeyz_db_connect_seconds': ('histogram', 'Time to open a MySQL connection'),
+    'hikeyz_db_connect_errors_total': ('counter', 'Failed MySQL connection attempts'),
+    'hikeyz_db_procedure_seconds': ('histogram', 'Stored procedure round-trip time'),
+    'hikeyz_cdn_bytes_total': ('counter', 'Bytes downloaded from the SUNO CDN'),
+    'hikeyz_song_download_seconds': ('histogram', 'Per-song CDN download latency by result'),
+    'hikeyz_jobs_queued': ('gauge', 'Download jobs waiting to start'),
+    'hikeyz_jobs_in_flight': ('gauge', 'Download jobs currently processing'),
+    'hikeyz_active_sessions': ('gauge', 'Entries in active_sessions'),
+    'hikeyz_ad_views': ('gauge', 'Entries in ad_views'),
+    'hikeyz_rate_limited_total': ('counter', 'Requests rejected by rate limiting, by rule'),
+    'hikeyz_jobs_reclaimed_total': ('counter', 'Stalled or overlong jobs reclaimed by the watchdog, by action'),
+}
+
+metrics_local = threading.local()
+metrics_shards = []  # [{'thread', 'counters', 'histograms'}]
+metrics_retired = {'counters': {}, 'histograms': {}}  # Folded shards of finished threads
+metrics_shards_lock = threading.Lock()  # Only taken on shard creation and scrape
+
+def get_metrics_shard():
+    """Return this thread's metrics shard, creating it on first use"""
+    shard = getattr(metrics_local, 'shard', None)
+    if shard is None:
+        shard = {'thread': threading.current_thread(), 'counters': {}, 'histograms': {}}
+        metrics_local.shard = shard
+        with metrics_shards_lock:
+            metrics_shards.append(shard)
+    return shard
+
+def inc_counter(name, labels=(), value=1):
+    """Add to a counter; labels is a tuple of (key, value) pairs"""
+    counters = get_metrics_shard()['counters']
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+def observe_histogram(name, labels, seconds):
+    """Record one observation; the histogram is [bucket counts..., +Inf count, sum]"""
+    histograms = get_metrics_shard()['histograms']
+    key = (name, labels)
+    hist = histograms.get(key)
+    if hist is None:
+        hist = histograms[key] = [0] * (len(METRICS_LATENCY_BUCKETS) + 2)
+    for i, bound in enumerate(METRICS_LATENCY_BUCKETS):
+        if seconds <= bound:
+            hist[i] += 1
+            break
+    else:
+        hist[len(METRICS_LATENCY_BUCKETS)] += 1
+    hist[-1] += seconds
+
+def merge_metrics(target, shard):
+    """Add a shard's counters and histograms into target"""
+    for key, value in list(shard['counters'].items()):
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for key, hist in list(shard['histograms'].items()):
+        merged = target['histograms'].setdefault(key, [0] * len(hist))
+        for i, value in enumerate(list(hist)):
+            merged[i] += value
+
+def collect_metrics():
+    """Merge all shards into one snapshot, folding shards of finished threads"""
+    snapshot = {'counters': {}, 'histograms': {}}
+    with metrics_shards_lock:
+        for shard in list(metrics_shards):
+            if not shard['thread'].is_alive():
+                merge_metrics(metrics_retired, shard)
+                metrics_shards.remove(shard)
+        merge_metrics(snapshot, metrics_retired)
+        shards = list(metrics_shards)
+
+    for shard in shards:
+        merge_metrics(snapshot, shard)
+    return snapshot
+
+def format_labels(labels, extra=()):
+    """Render a label tuple as {k="v",...}"""
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + body + '}'
+
+def render_metrics():
+    """Render the current metrics in Prometheus text format"""
+    snapshot = collect_metrics()
+
+    jobs = list(download_jobs.values())
+    gauges = {
+        'hikeyz_jobs_queued': sum(1 for job in jobs if job.get('status') == 'queued'),
+        'hikeyz_jobs_in_flight': sum(1 for job in jobs if job.get('status') == 'processing'),
+        'hikeyz_active_sessions': len(active_sessions),
+        'hikeyz_ad_views': len(ad_views),
+    }
+
+    series = {}
+    for (name, labels), value in snapshot['counters'].items():
+        series.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+    for (name, labels), hist in snapshot['histograms'].items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(METRICS_LATENCY_BUCKETS, hist):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+        cumulative += hist[len(METRICS_LATENCY_BUCKETS)]
+        lines.append(f"{name}_bucket{format_labels(labels, (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {hist[-1]}")
+        lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    for name, value in gauges.items():
+        series[name] = [f"{name} {value}"]
+
+    output = []
+    for name in sorted(series):
+        metric_type, help_text = METRICS_HELP.get(name, ('untyped', name))
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+def record_song_download(seconds, bytes_downloaded, success):
+    """Worker callback: per-song CDN latency and bytes moved"""
+    observe_histogram('hikeyz_song_download_seconds', (('result', 'success' if success else 'failed'),), seconds)
+    if bytes_downloaded:
+        inc_counter('hikeyz_cdn_bytes_total', (), bytes_downloaded)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.log_context_token = bind_log_context(method=request.method, path=request.path)
+
+@app.teardown_request
+def reset_request_log_context(exc):
+    token = g.pop('log_context_token', None)
+    if token is not None:
+        reset_log_context(token)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method), ('status', response.status_code))
+        inc_counter('hikeyz_http_requests_total', labels)
+        observe_histogram('hikeyz_http_request_duration_seconds', labels, time.perf_counter() - started)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                                    f"Bearer {METRICS_TOKEN}".encode('utf-8')):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# ==================== PROFILING ====================
+
+# Opt-in sampling profiler (workers/sampling_profiler.py). Nothing is hooked
+# unless PROFILE_TOKEN is set. A request is profiled when it sends
+# "X-Profile: request" with a matching X-Profile-Token, or when the admin
+# toggle has profiling slots left; "X-Profile: job" on /api/start-download
+# profiles that job's SUNODownloader.run. Profiles are written to PROFILE_DIR
+# as collapsed stacks; PROFILE_DIR and the sampling limits are defined in
+# sampling_profiler, shared with the worker.
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+
+profiling_toggle = {'requests': 0, 'jobs': 0, 'path_prefix': '/'}
+profiling_toggle_lock = threading.Lock()
+
+def load_profiler_class():
+    """Import the sampling profiler on first use"""
+    from sampling_profiler import SamplingProfiler
+    return SamplingProfiler
+
+def profiling_authorized():
+    """True if the request carries the profiling token"""
+    token = request.headers.get('X-Profile-Token', '').encode('utf-8')
+    return bool(PROFILE_TOKEN) and secrets.compare_digest(token, PROFILE_TOKEN.encode('utf-8'))
+
+def profiling_requested(kind):
+    """True if the request asks for profiling of `kind` ('request' or 'job') with a valid token"""
+    requested = [v.strip() for v in request.headers.get('X-Profile', '').split(',')]
+    return kind in requested and profiling_authorized()
+
+def take_profiling_slot(kind, path=None):
+    """Consume one slot from the admin toggle; kind is 'requests' or 'jobs'"""
+    if not profiling_toggle[kind]:
+        return False
+    with profiling_toggle_lock:
+        if profiling_toggle[kind] <= 0:
+            return False
+        if path is not None and not path.startswith(profiling_toggle['path_prefix']):
+            return False
+        profiling_toggle[kind] -= 1
+        return True
+
+def should_profile_job():
+    """Whether the job being started should run under the profiler"""
+    if not PROFILE_TOKEN:
+        return False
+    return profiling_requested('job') or take_profiling_slot('jobs')
+
+if PROFILE_TOKEN:
+    @app.before_request
+    def start_request_profiler():
+        if request.path == '/api/admin/profiling':
+            return
+        if profiling_requested('request') or take_profiling_slot('requests', request.path):
+            SamplingProfiler = load_profiler_class()
+            g.profiler = SamplingProfiler(
+                interval=PROFILE_INTERVAL_MS / 1000, max_seconds=PROFILE_MAX_SECONDS
+            ).start()
+
+    @app.after_request
+    def save_request_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            try:
+                path = profiler.save(PROFILE_DIR, f"{request.method}-{request.path}")
+                response.headers['X-Profile-File'] = os.path.basename(path)
+            except Exception as e:
+                log.error(f"Profile save error: {e}")
+        return response
+
+    @app.teardown_request
+    def stop_request_profiler(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """
+    Show or set the profiling toggle (requires X-Profile-Token)
+
+    Request body (POST):
+    {
+        "requests": 5,           # Profile the next N matching requests
+        "path_prefix": "/api/",  # Optional: only requests under this path
+        "jobs": 1                # Profile the next N download jobs
+    }
+    """
+    if not profiling_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        with profiling_toggle_lock:
+            try:
+                if 'requests' in data:
+                    profiling_toggle['requests'] = max(0, int(data['requests']))
+                if 'jobs' in data:
+                    profiling_toggle['jobs'] = max(0, int(data['jobs']))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'requests and jobs must be integers'}), 400
+            if 'path_prefix' in data:
+                profiling_toggle['path_prefix'] = str(data['path_prefix'] or '/')
+
+    with profiling_toggle_lock:
+        toggle = dict(profiling_toggle)
+
+    return jsonify({
+        'success': True,
+        'profile_dir': PROFILE_DIR,
+        'pending_requests': toggle['requests'],
+        'pending_jobs': toggle['jobs'],
+        'path_prefix': toggle['path_prefix']
+    })
+
+# ==================== STORED PROCEDURE CALLS ====================
+
+def call_procedure(cursor, name, args, out_count):
+    """
+    Call a stored procedure in one round trip and return its status row
+
+    The procedures finish with a SELECT of success, error_message and the
+    resulting balance/amounts, so the CALL and its result share a single
+    request instead of CALL + SELECT @outs + SELECT balance. OUT parameters
+    are bound to session variables and otherwise ignored.
+
+    Returns the status row as a dict, or None if the procedure returned nothing.
+    """
+    out_vars = [f"@_{name}_out{i}" for i in range(out_count)]
+    placeholders = ', '.join(['%s'] * len(args) + out_vars)
+
+    status = None
+    start = time.perf_counter()
+    for result in cursor.execute(f"CALL {name}({placeholders})", args, multi=True):
+        if result.with_rows:
+            rows = result.fetchall()
+            if rows and status is None:
+                row = rows[-1]
+                status = row if isinstance(row, dict) else dict(zip(result.column_names, row))
+    observe_histogram('hikeyz_db_procedure_seconds', (('procedure', name),), time.perf_counter() - start)
+
+    return status
+
+# ==================== CATALOG CACHE ====================
+
+# Credit packages and pricing config are read-mostly, so they are cached
+# in-process with a TTL instead of being queried on every request. Each
+# process has its own cache: after a DB edit, other processes and nodes
+# serve the old values for up to CATALOG_CACHE_TTL_SECONDS.
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv('CATALOG_CACHE_TTL_SECONDS', 300))
+DEFAULT_CREDITS_PER_SONG = 0.35  # Used only if pricing_config is unreachable
+
+catalog_cache = {}  # key -> (expires_at, value)
+catalog_cache_lock = threading.Lock()
+
+def get_cached_catalog(key, loader):
+    """
+    Return a cached catalog value, reloading it with `loader` once the TTL expires
+
+    Reloads are serialized so a burst of requests triggers a single query.
+    If the loader fails, the stale value (if any) keeps being served.
+    """
+    entry = catalog_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    with catalog_cache_lock:
+        entry = catalog_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        value = loader()
+        if value is None:
+            return entry[1] if entry else None
+
+        catalog_cache[key] = (time.monotonic() + CATALOG_CACHE_TTL_SECONDS, value)
+        return value
+
+def invalidate_catalog_cache(key=None):
+    """Drop one cached catalog entry (or all of them) so the next read reloads it"""
+    with catalog_cache_lock:
+        if key is None:
+            catalog_cache.clear()
+        else:
+            catalog_cache.pop(key, None)
+
+def load_credit_packages():
+    """Load active credit packages from the database (None on failure)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT id, package_name, usd_amount, base_credits,
+                   bonus_credits, total_credits
+            FROM credit_packages
+            WHERE is_active = TRUE
+            ORDER BY display_order
+        """)
+        packages = cursor.fetchall()
+
+        for package in packages:
+            package['usd_amount'] = float(package['usd_amount'])
+            package['base_credits'] = float(package['base_credits'])
+            package['bonus_credits'] = float(package['bonus_credits'])
+            package['total_credits'] = float(package['total_credits'])
+
+        return packages
+
+    except Error as e:
+        log.error(f"Error loading credit packages: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def load_pricing_config():
+    """Load pricing_config as a {config_key: value} dict (None on failure)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("SELECT config_key, config_value FROM pricing_config")
+        return {row['config_key']: float(row['config_value']) for row in cursor.fetchall()}
+
+    except Error as e:
+        log.error(f"Error loading pricing config: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_credit_packages_cached():
+    """Active credit packages, ordered for display"""
+    return get_cached_catalog('credit_packages', load_credit_packages) or []
+
+def load_credit_package(package_id):
+    """Load one credit package by ID from the database, active or not (None if missing or on failure)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT id, package_name, usd_amount, base_credits, bonus_credits, total_credits
+            FROM credit_packages
+            WHERE id = %s
+        """, (package_id,))
+        package = cursor.fetchone()
+
+        if package:
+            for column in ('usd_amount', 'base_credits', 'bonus_credits', 'total_credits'):
+                package[column] = float(package[column])
+        return package
+
+    except Error as e:
+        log.error(f"Error loading credit package {package_id}: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_credit_package(package_id, include_inactive=False):
+    """
+    Look up a credit package by ID (None if unknown)
+
+    Active packages come from the cache. With include_inactive, a package
+    that has been deactivated since is read from the database, for flows
+    that reference packages by ID after the fact (purchases, webhooks).
+    """
+    try:
+        package_id = int(package_id)
+    except (TypeError, ValueError):
         return None
 
+    for package in get_credit_packages_cached():
+        if package['id'] == package_id:
+            return package
+
+    if include_inactive:
+        return load_credit_package(package_id)
+    return None
+
+def get_credits_per_song():
+    """Per-song price in credits, as configured in pricing_config"""
+    pricing = get_cached_catalog('pricing_config', load_pricing_config) or {}
+    return pricing.get('credits_per_song', DEFAULT_CREDITS_PER_SONG)
+
+# ==================== PIN HASHING ====================
+
+# bcrypt runs on a small dedicated pool so a login burst is capped at a fixed
+# amount of CPU. When the pool's queue is full, callers get PinHasherBusy
+# (surfaced as 429) instead of piling up behind it.
+#
+# The pool does not free the request thread: the handler still waits on the
+# result, so every pending hash parks one gthread thread. PIN_HASH_MAX_PENDING
+# is therefore what bounds the threads tied up by logins; keep it well below
+# gunicorn's --threads (16) so other endpoints stay served during a burst.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+PIN_HASH_WORKERS = int(os.getenv('PIN_HASH_WORKERS', 2))
+PIN_HASH_MAX_PENDING = int(os.getenv('PIN_HASH_MAX_PENDING', PIN_HASH_WORKERS * 2))  # Running + queued
+PIN_HASH_TIMEOUT_SECONDS = 10
+
+pin_hash_executor = ThreadPoolExecutor(max_workers=PIN_HASH_WORKERS, thread_name_prefix='pin-hash')
+pin_hash_slots = threading.BoundedSemaphore(PIN_HASH_MAX_PENDING)
+
+class PinHasherBusy(Exception):
+    """Raised when the PIN hashing pool is saturated"""
+
+def run_pin_task(func, *args):
+    """
+    Run a bcrypt call on the PIN hashing pool and wait for its result
+
+    The calling request thread blocks until the hash is done; the pool caps
+    CPU, and PIN_HASH_MAX_PENDING caps how many request threads can wait.
+    """
+    if not pin_hash_slots.acquire(blocking=False):
+        raise PinHasherBusy()
+
+    try:
+        future = pin_hash_executor.submit(func, *args)
+    except Exception:
+        pin_hash_slots.release()
+        raise
+    future.add_done_callback(lambda f: pin_hash_slots.release())
+
+    try:
+        return future.result(timeout=PIN_HASH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise PinHasherBusy()
+
+def pin_busy_response():
+    """429 response returned when PIN hashing is saturated"""
+    response = jsonify({'error': 'Too many login attempts right now. Please try again shortly.'})
+    response.headers['Retry-After'] = '2'
+    return response, 429
+
 def hash_pin(pin):
     """Hash a PIN using bcrypt"""
-    return bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return run_pin_task(
+        lambda: bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+    )
 
 def verify_pin(pin, pin_hash):
     """Verify a PIN against its hash"""
-    return bcrypt.checkpw(pin.encode('utf-8'), pin_hash.encode('utf-8'))
+    return run_pin_task(
+        lambda: bcrypt.checkpw(pin.encode('utf-8'), pin_hash.encode('utf-8'))
+    )
+
+def pin_needs_rehash(pin_hash):
+    """True if a stored hash was made with a different bcrypt cost than BCRYPT_ROUNDS"""
+    try:
+        return int(pin_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
 
 # Stripe Configuration
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY', 'sk_test_YOUR_KEY_HERE')
@@ -76,6 +628,140 @@ PRICING_PLANS = {
 active_sessions = {}
 download_jobs = {}
 
+# ==================== JOB PROGRESS STREAMING ====================
+
+# Progress events are published in-process by the download worker and fanned
+# out to Server-Sent Events subscribers, so viewers no longer poll the
+# progress file every 2 seconds.
+PROGRESS_EVENT_BUFFER = 100  # Events kept per job for Last-Event-ID resume
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = int(os.getenv('SSE_MAX_STREAM_SECONDS', 120))  # Client reconnects and resumes
+# Every open stream and ?since= long-poll holds a gunicorn thread while it
+# waits, so this must stay well below --threads (render.yaml) or they starve
+# every other route. Past the cap, streams get 503 (progress.html falls back
+# to polling) and long-polls answer at once with the current snapshot.
+PROGRESS_WAIT_MAX_CONCURRENT = int(os.getenv('PROGRESS_WAIT_MAX_CONCURRENT', 4))
+JOB_STATUS_MAX_WAIT_SECONDS = int(os.getenv('JOB_STATUS_MAX_WAIT_SECONDS', 25))  # Cap for /api/job-status ?since= long-polls
+JOB_TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+# Channels are dropped this long after their job finishes (or, if nothing was
+# ever published, after creation); later requests fall back to the progress file
+PROGRESS_CHANNEL_RETENTION_SECONDS = int(os.getenv('PROGRESS_CHANNEL_RETENTION_SECONDS', 900))
+PROGRESS_CHANNEL_SWEEP_SECONDS = 60
+
+job_progress_channels = {}
+job_progress_channels_lock = threading.Lock()
+progress_channel_sweep = {'at': time.monotonic()}
+progress_wait_slots = threading.BoundedSemaphore(PROGRESS_WAIT_MAX_CONCURRENT)
+
+def prune_progress_channels(now):
+    """Drop channels of jobs finished longer ago than the retention (caller holds the lock)"""
+    cutoff = now - PROGRESS_CHANNEL_RETENTION_SECONDS
+    for job_id, channel in list(job_progress_channels.items()):
+        finished_at = channel.get('finished_at')
+        if (finished_at is not None and finished_at < cutoff) or \
+                (channel['seq'] == 0 and channel['created_at'] < cutoff):
+            del job_progress_channels[job_id]
+
+def get_progress_channel(job_id):
+    """Return the progress channel for a job, creating it if needed"""
+    with job_progress_channels_lock:
+        channel = job_progress_channels.get(job_id)
+        if channel is None:
+            now = time.monotonic()
+            if now - progress_channel_sweep['at'] >= PROGRESS_CHANNEL_SWEEP_SECONDS:
+                progress_channel_sweep['at'] = now
+                prune_progress_channels(now)
+
+            channel = {
+                'cond': threading.Condition(),
+                'seq': 0,  # Last published event id
+                'state': {},  # Latest full progress snapshot
+                'events': deque(maxlen=PROGRESS_EVENT_BUFFER),  # (seq, delta) pairs
+                'created_at': now,
+                'finished_at': None  # Set while the job is in a terminal status
+            }
+            job_progress_channels[job_id] = channel
+        return channel
+
+def publish_job_progress(job_id, progress):
+    """
+    Publish a progress update for a job
+
+    Only the fields that changed since the last update are recorded as an
+    event; subscribers are woken up only when there is something to send.
+    """
+    channel = get_progress_channel(job_id)
+
+    with channel['cond']:
+        state = channel['state']
+        delta = {key: value for key, value in progress.items()
+                 if key not in state or state[key] != value}
+        if not delta:
+            return
+
+        channel['seq'] += 1
+        state.update(delta)
+        channel['events'].append((channel['seq'], delta))
+        if 'status' in delta:
+            channel['finished_at'] = time.monotonic() if delta['status'] in JOB_TERMINAL_STATUSES else None
+        channel['cond'].notify_all()
+
+def format_sse(data, event=None, event_id=None):
+    """Format a single Server-Sent Events message"""
+    message = ''
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data)}\n\n"
+    return message
+
+def collect_progress_events(channel, last_event_id):
+    """
+    Collect the messages a subscriber is missing (caller holds channel['cond'])
+
+    Returns a list of SSE messages. Buffered deltas are replayed when the
+    subscriber's last event is still in the buffer, otherwise a full snapshot
+    is sent.
+    """
+    seq = channel['seq']
+    events = channel['events']
+
+    if last_event_id is not None and last_event_id >= seq:
+        return []
+
+    oldest_seq = events[0][0] if events else seq + 1
+    if last_event_id is None or last_event_id < oldest_seq - 1:
+        return [format_sse(dict(channel['state']), event='snapshot', event_id=seq)]
+
+    return [format_sse(delta, event='progress', event_id=event_seq)
+            for event_seq, delta in events if event_seq > last_event_id]
+
+def stream_job_progress(job_id, last_event_id):
+    """Generator yielding SSE messages for a job until it finishes or the stream times out"""
+    channel = get_progress_channel(job_id)
+    deadline = time.time() + SSE_MAX_STREAM_SECONDS
+
+    yield "retry: 3000\n\n"
+
+    while True:
+        with channel['cond']:
+            messages = collect_progress_events(channel, last_event_id)
+            if not messages:
+                channel['cond'].wait(timeout=min(SSE_HEARTBEAT_SECONDS, max(0, deadline - time.time())))
+                messages = collect_progress_events(channel, last_event_id)
+            last_event_id = channel['seq']
+            finished = channel['state'].get('status') in JOB_TERMINAL_STATUSES
+
+        if messages:
+            for message in messages:
+                yield message
+        else:
+            yield ": heartbeat\n\n"
+
+        if finished or time.time() >= deadline:
+            return
+
 @app.route('/')
 def index():
     """Health check"""
@@ -135,93 +821,77 @@ def create_checkout_session():
         if not package_id:
             return jsonify({'error': 'Package ID is required'}), 400
 
-        # Get package details from database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
+        # Get package details from the catalog cache
+        package = get_credit_package(package_id)
 
-        cursor = conn.cursor(dictionary=True)
+        if not package:
+            return jsonify({'error': 'Invalid or inactive package'}), 400
 
+        # Create Stripe Price dynamically (or use existing price_id if stored in DB)
+        # For now, create a one-time payment price
         try:
-            cursor.execute("""
-                SELECT id, package_name, usd_amount, base_credits, bonus_credits, total_credits
-                FROM credit_packages
-                WHERE id = %s AND is_active = TRUE
-            """, (package_id,))
-
-            package = cursor.fetchone()
-
-            if not package:
-                return jsonify({'error': 'Invalid or inactive package'}), 400
-
-            # Create Stripe Price dynamically (or use existing price_id if stored in DB)
-            # For now, create a one-time payment price
-            try:
-                # Try to create or retrieve price
-                price = stripe.Price.create(
-                    unit_amount=int(float(package['usd_amount']) * 100),  # Convert to cents
-                    currency='usd',
-                    product_data={
-                        'name': package['package_name'],
-                        'description': f"{package['total_credits']} credits ({package['base_credits']} base + {package['bonus_credits']} bonus)"
-                    },
-                    metadata={
-                        'package_id': str(package_id),
-                        'total_credits': str(package['total_credits'])
-                    }
-                )
-                price_id = price.id
-            except Exception as e:
-                print(f"Error creating Stripe price: {e}")
-                return jsonify({'error': 'Failed to create payment session'}), 500
-
-            # Create Stripe Checkout Session
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price': price_id,
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url=success_url + '?session_id={CHECKOUT_SESSION_ID}',
-                cancel_url=cancel_url,
-                client_reference_id=str(user_id),  # Store user_id for webhook
-                customer_email=session.get('email'),  # Pre-fill email if available
+            # Try to create or retrieve price
+            price = stripe.Price.create(
+                unit_amount=int(float(package['usd_amount']) * 100),  # Convert to cents
+                currency='usd',
+                product_data={
+                    'name': package['package_name'],
+                    'description': f"{package['total_credits']} credits ({package['base_credits']} base + {package['bonus_credits']} bonus)"
+                },
                 metadata={
-                    'user_id': str(user_id),
                     'package_id': str(package_id),
-                    'package_name': package['package_name'],
-                    'total_credits': str(package['total_credits']),
-                    'base_credits': str(package['base_credits']),
-                    'bonus_credits': str(package['bonus_credits']),
-                    'usd_amount': str(package['usd_amount']),
-                    'payment_type': 'fiat_stripe'
+                    'total_credits': str(package['total_credits'])
                 }
             )
-
-            print(f"Created Stripe checkout session for user {user_id}, package {package_id}")
-
-            return jsonify({
-                'checkout_url': checkout_session.url,
-                'session_id': checkout_session.id,
+            price_id = price.id
+        except Exception as e:
+            log.error(f"Error creating Stripe price: {e}")
+            return jsonify({'error': 'Failed to create payment session'}), 500
+
+        # Create Stripe Checkout Session
+        checkout_session = stripe.checkout.Session.create(
+            payment_method_types=['card'],
+            line_items=[{
+                'price': price_id,
+                'quantity': 1,
+            }],
+            mode='payment',
+            success_url=success_url + '?session_id={CHECKOUT_SESSION_ID}',
+            cancel_url=cancel_url,
+            client_reference_id=str(user_id),  # Store user_id for webhook
+            customer_email=session.get('email'),  # Pre-fill email if available
+            metadata={
+                'user_id': str(user_id),
+                'package_id': str(package_id),
                 'package_name': package['package_name'],
-                'total_credits': float(package['total_credits']),
-                'usd_amount': float(package['usd_amount'])
-            })
+                'total_credits': str(package['total_credits']),
+                'base_credits': str(package['base_credits']),
+                'bonus_credits': str(package['bonus_credits']),
+                'usd_amount': str(package['usd_amount']),
+                'payment_type': 'fiat_stripe'
+            }
+        )
 
-        finally:
-            cursor.close()
-            conn.close()
+        log.info(f"Created Stripe checkout session for user {user_id}, package {package_id}")
+
+        return jsonify({
+            'checkout_url': checkout_session.url,
+            'session_id': checkout_session.id,
+            'package_name': package['package_name'],
+            'total_credits': float(package['total_credits']),
+            'usd_amount': float(package['usd_amount'])
+        })
 
     except Exception as e:
-        print(f"Error creating checkout session: {e}")
+        log.error(f"Error creating checkout session: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/webhook', methods=['POST'])
 def stripe_webhook():
     """
     Handle Stripe webhook events
-    Processes payment completion and adds credits to user accounts
+    Verifies the signature and queues the event in the webhook inbox;
+    payment completion is processed asynchronously by the inbox consumer
     """
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
@@ -231,43 +901,23 @@ def stripe_webhook():
             payload, sig_header, STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
-        print(f"Invalid payload in webhook: {e}")
+        log.error(f"Invalid payload in webhook: {e}")
         return jsonify({'error': 'Invalid payload'}), 400
     except stripe.error.SignatureVerificationError as e:
-        print(f"Invalid signature in webhook: {e}")
+        log.error(f"Invalid signature in webhook: {e}")
         return jsonify({'error': 'Invalid signature'}), 400
 
-    # Handle the event
-    try:
-        if event['type'] == 'checkout.session.completed':
-            stripe_session = event['data']['object']
-            print(f"Processing checkout.session.completed for session: {stripe_session.get('id')}")
-            
-            result = handle_successful_payment(stripe_session)
-            
-            if result and result.get('success'):
-                print(f"Successfully processed payment: {result}")
-            else:
-                print(f"Failed to process payment: {result}")
-
-        elif event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            print(f"Payment intent succeeded: {payment_intent['id']}")
-            # Credits are added via checkout.session.completed, so we just log this
-
-        elif event['type'] == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            print(f"Payment intent failed: {payment_intent['id']}")
-
-        else:
-            print(f"Unhandled webhook event type: {event['type']}")
+    # Persist to the inbox and acknowledge right away; the consumer thread
+    # does the actual work. Duplicate deliveries of the same event id are
+    # ignored by the primary key.
+    stored = store_webhook_event(event['id'], event['type'], payload)
+    if stored is None:
+        # Not persisted: let Stripe retry the delivery
+        return jsonify({'status': 'error', 'message': 'Could not store event'}), 503
 
-    except Exception as e:
-        print(f"Error processing webhook event: {e}")
-        # Still return 200 to prevent Stripe from retrying
-        return jsonify({'status': 'error', 'message': str(e)}), 200
+    webhook_inbox_wakeup.set()
 
-    return jsonify({'status': 'success'})
+    return jsonify({'status': 'success', 'duplicate': not stored})
 
 @app.route('/api/payment/verify', methods=['POST'])
 def verify_payment():
@@ -337,7 +987,7 @@ def verify_payment():
             package_name = metadata.get('package_name', 'Unknown')
             total_credits = float(metadata.get('total_credits', 0))
 
-            credits_per_song = 0.35
+            credits_per_song = get_credits_per_song()
             songs_available = int(float(user['credit_balance']) / credits_per_song)
 
             return jsonify({
@@ -356,7 +1006,7 @@ def verify_payment():
             conn.close()
 
     except Exception as e:
-        print(f"Error verifying payment: {e}")
+        log.error(f"Error verifying payment: {e}")
         return jsonify({'error': str(e)}), 500
 
 def handle_successful_payment(stripe_session):
@@ -379,13 +1029,13 @@ def handle_successful_payment(stripe_session):
             payment_intent_id = stripe_session.get('payment_intent')
             
             if not user_id or not package_id:
-                print(f"ERROR: Missing user_id or package_id in Stripe session metadata")
+                log.error("Missing user_id or package_id in Stripe session metadata")
                 return None
             
             # Connect to database
             conn = get_db_connection()
             if not conn:
-                print(f"ERROR: Database connection failed for payment processing")
+                log.error("Database connection failed for payment processing")
                 return None
             
             cursor = conn.cursor(dictionary=True)
@@ -395,30 +1045,23 @@ def handle_successful_payment(stripe_session):
                 # Parameters: user_id (IN), package_id (IN), payment_method (IN), tx_hash (IN), success (OUT), error_message (OUT)
                 payment_method = 'stripe_card'
                 tx_hash = payment_intent_id or stripe_session_id  # Use payment_intent_id as transaction hash
-                
-                cursor.callproc('add_credits', [user_id, package_id, payment_method, tx_hash, None, None])
-                
-                # Get OUT parameters (indices 4 and 5 for the OUT parameters)
-                cursor.execute("SELECT @_add_credits_4 AS success, @_add_credits_5 AS error_message")
-                result = cursor.fetchone()
-                
+
+                # add_credits skips a tx_hash that was already credited (checked under the user row lock)
+                result = call_procedure(cursor, 'add_credits', [user_id, package_id, payment_method, tx_hash], 2)
+
+                if result and result.get('success') and result.get('error_message') == 'Already credited':
+                    log.warning(f"Payment {tx_hash} already credited to user {user_id}; skipping")
+                    return {'success': True, 'user_id': user_id, 'package_id': package_id, 'duplicate': True}
+
                 if result and result.get('success'):
-                    # Get updated balance
-                    cursor.execute("""
-                        SELECT credit_balance FROM users WHERE id = %s
-                    """, (user_id,))
-                    user = cursor.fetchone()
-                    new_balance = float(user['credit_balance']) if user else 0.0
+                    new_balance = float(result['new_balance'] or 0)
                     
                     # Get package details for logging
-                    cursor.execute("""
-                        SELECT package_name, total_credits FROM credit_packages WHERE id = %s
-                    """, (package_id,))
-                    package = cursor.fetchone()
+                    package = get_credit_package(package_id, include_inactive=True)
                     
                     conn.commit()
                     
-                    print(f"SUCCESS: Added {package['total_credits'] if package else 'unknown'} credits to user {user_id} "
+                    log.info(f"Added {package['total_credits'] if package else 'unknown'} credits to user {user_id} "
                           f"(new balance: {new_balance}) via Stripe payment {stripe_session_id}")
                     
                     return {
@@ -430,12 +1073,12 @@ def handle_successful_payment(stripe_session):
                     }
                 else:
                     error_msg = result.get('error_message', 'Unknown error') if result else 'Unknown error'
-                    print(f"ERROR: Failed to add credits for user {user_id}, package {package_id}: {error_msg}")
+                    log.error(f"Failed to add credits for user {user_id}, package {package_id}: {error_msg}")
                     conn.rollback()
                     return None
                     
             except Exception as e:
-                print(f"ERROR: Exception while processing payment: {e}")
+                log.error(f"Exception while processing payment: {e}")
                 conn.rollback()
                 return None
             finally:
@@ -471,15 +1114,207 @@ def handle_successful_payment(stripe_session):
                     'stripe_session_id': stripe_session['id']
                 }
                 
-                print(f"Created legacy session: {session_token} for plan: {plan_type}")
+                log.info(f"Created legacy session: {session_token} for plan: {plan_type}")
                 return {'session_token': session_token}
+
+            # Nothing to credit; reported as handled so the inbox does not retry it
+            log.warning(f"Ignoring checkout session {stripe_session.get('id')} with unknown plan type: {plan_type}")
+            return {'ignored': True, 'plan_type': plan_type}
         
         return None
         
     except Exception as e:
-        print(f"ERROR: handle_successful_payment exception: {e}")
+        log.error(f"handle_successful_payment exception: {e}")
         return None
 
+# ==================== STRIPE WEBHOOK INBOX ====================
+
+# Webhook events are written to stripe_webhook_events (keyed by Stripe event
+# id) and acknowledged immediately. A background consumer in each API
+# process claims pending events and processes them, so webhook latency does
+# not depend on the DB work and redeliveries are deduplicated.
+WEBHOOK_INBOX_POLL_SECONDS = 5
+WEBHOOK_INBOX_BATCH_SIZE = 20
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_STALE_CLAIM_MINUTES = 10  # Reclaim events whose consumer died mid-processing
+
+webhook_inbox_wakeup = threading.Event()
+webhook_consumer_started = False
+webhook_consumer_lock = threading.Lock()
+
+def store_webhook_event(event_id, event_type, payload):
+    """
+    Insert a verified webhook event into the inbox
+
+    Returns True if stored, False if the event id was already present,
+    or None if the database is unavailable.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            INSERT IGNORE INTO stripe_webhook_events (event_id, event_type, payload)
+            VALUES (%s, %s, %s)
+        """, (event_id, event_type, payload))
+        conn.commit()
+        return cursor.rowcount == 1
+
+    except Error as e:
+        log.error(f"Error storing webhook event {event_id}: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def process_stripe_event(event):
+    """
+    Apply a single Stripe event
+
+    Returns True when the event is fully handled (including events with
+    nothing to do), False if it should be retried.
+    """
+    if event['type'] == 'checkout.session.completed':
+        stripe_session = event['data']['object']
+        log.info(f"Processing checkout.session.completed for session: {stripe_session.get('id')}")
+
+        result = handle_successful_payment(stripe_session)
+
+        if result:
+            log.info(f"Successfully processed payment: {result}")
+            return True
+
+        log.error(f"Failed to process payment: {result}")
+        return False
+
+    elif event['type'] == 'payment_intent.succeeded':
+        payment_intent = event['data']['object']
+        log.info(f"Payment intent succeeded: {payment_intent['id']}")
+        # Credits are added via checkout.session.completed, so we just log this
+
+    elif event['type'] == 'payment_intent.payment_failed':
+        payment_intent = event['data']['object']
+        log.warning(f"Payment intent failed: {payment_intent['id']}")
+
+    else:
+        log.info(f"Unhandled webhook event type: {event['type']}")
+
+    return True
+
+def claim_webhook_events(cursor, conn):
+    """Claim a batch of pending events for this process (returns their rows)"""
+    cursor.execute("""
+        SELECT event_id
+        FROM stripe_webhook_events
+        WHERE status = 'pending'
+           OR (status = 'processing' AND claimed_at < NOW() - INTERVAL %s MINUTE)
+        ORDER BY received_at
+        LIMIT %s
+    """, (WEBHOOK_STALE_CLAIM_MINUTES, WEBHOOK_INBOX_BATCH_SIZE))
+    candidates = [row['event_id'] for row in cursor.fetchall()]
+
+    claimed = []
+    for event_id in candidates:
+        # Conditional update so only one process wins each event
+        cursor.execute("""
+            UPDATE stripe_webhook_events
+            SET status = 'processing', attempts = attempts + 1, claimed_at = NOW()
+            WHERE event_id = %s
+              AND (status = 'pending'
+                   OR (status = 'processing' AND claimed_at < NOW() - INTERVAL %s MINUTE))
+        """, (event_id, WEBHOOK_STALE_CLAIM_MINUTES))
+        conn.commit()
+
+        if cursor.rowcount == 1:
+            cursor.execute("""
+                SELECT event_id, payload, attempts
+                FROM stripe_webhook_events
+                WHERE event_id = %s
+            """, (event_id,))
+            claimed.append(cursor.fetchone())
+
+    return claimed
+
+def drain_webhook_inbox():
+    """Process pending inbox events until none are left (returns number handled)"""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor(dictionary=True)
+    handled = 0
+
+    try:
+        while True:
+            events = claim_webhook_events(cursor, conn)
+            if not events:
+                return handled
+
+            retry_later = False
+            for row in events:
+                try:
+                    processed = process_stripe_event(json.loads(row['payload']))
+                    error_message = None if processed else 'Processing failed'
+                except Exception as e:
+                    log.error(f"Error processing webhook event {row['event_id']}: {e}")
+                    processed = False
+                    error_message = str(e)[:1000]
+
+                if processed:
+                    status = 'processed'
+                elif row['attempts'] >= WEBHOOK_MAX_ATTEMPTS:
+                    status = 'failed'
+                else:
+                    status = 'pending'  # Retried on the next pass
+
+                cursor.execute("""
+                    UPDATE stripe_webhook_events
+                    SET status = %s, last_error = %s,
+                        processed_at = IF(%s = 'processed', NOW(), processed_at)
+                    WHERE event_id = %s
+                """, (status, error_message, status, row['event_id']))
+                conn.commit()
+                handled += 1
+
+                retry_later = retry_later or status == 'pending'
+
+            if retry_later:
+                # The rest of the batch is done; don't spin on the failing
+                # event within this pass
+                return handled
+
+    except Error as e:
+        log.error(f"Webhook inbox error: {e}")
+        return handled
+    finally:
+        cursor.close()
+        conn.close()
+
+def run_webhook_consumer():
+    """Background loop draining the webhook inbox"""
+    while True:
+        webhook_inbox_wakeup.wait(timeout=WEBHOOK_INBOX_POLL_SECONDS)
+        webhook_inbox_wakeup.clear()
+        try:
+            drain_webhook_inbox()
+        except Exception as e:
+            log.error(f"Webhook consumer error: {e}")
+
+@app.before_request
+def ensure_webhook_consumer():
+    """Start this process's webhook consumer thread on its first request"""
+    global webhook_consumer_started
+    if webhook_consumer_started:
+        return
+
+    with webhook_consumer_lock:
+        if not webhook_consumer_started:
+            threading.Thread(target=run_webhook_consumer, daemon=True, name='webhook-consumer').start()
+            webhook_consumer_started = True
+
 @app.route('/api/validate-session', methods=['POST'])
 def validate_session():
     """
@@ -518,19 +1353,54 @@ def validate_session():
         }
     })
 
-def run_download_worker(job_id, session_token, credentials, max_songs):
+def load_downloader_class():
+    """
+    Import the SUNO downloader on first use.
+    Keeps Selenium and urllib3 out of API processes that never run a job.
+    """
+    from suno_downloader import SUNODownloader
+    return SUNODownloader
+
+def run_download_worker(job_id, session_token, credentials, max_songs, profile=False, attempt=1, started_at=None):
     """
     Background function to run the download worker
+    (profile=True samples the run and saves the profile to PROFILE_DIR;
+    started_at is when the job's first attempt started, on time.monotonic())
     """
+    bind_log_context(job_id=job_id, user_id=active_sessions.get(session_token, {}).get('user_id'))
+    downloader = None
     try:
-        print(f"Starting download worker for job {job_id}")
+        log.info(f"Starting download worker for job {job_id} (attempt {attempt})")
 
         # Create downloader instance
-        downloader = SUNODownloader(job_id, session_token, credentials, max_songs)
+        SUNODownloader = load_downloader_class()
+        downloader = SUNODownloader(
+            job_id, session_token, credentials, max_songs,
+            progress_callback=lambda progress: publish_job_progress(job_id, progress),
+            song_metrics_callback=record_song_download,
+            profile_dir=PROFILE_DIR if profile else None
+        )
+        with job_workers_lock:
+            job_workers[job_id] = {
+                'downloader': downloader,
+                'attempt': attempt,
+                'started_at': started_at or time.monotonic(),
+                'args': (session_token, credentials, max_songs)
+            }
+
+        # Cancelled before this attempt registered, so cancel_job could not abort it
+        if download_jobs.get(job_id, {}).get('status') == 'cancelled':
+            release_job_worker(job_id, downloader)
+            log.info(f"Job {job_id} was cancelled before it started")
+            return
 
         # Run the download process
         result = downloader.run()
 
+        if not release_job_worker(job_id, downloader):
+            log.info(f"Job {job_id} was reclaimed or cancelled; discarding this attempt's result")
+            return
+
         # Update job status in memory
         if job_id in download_jobs:
             if result.get('success'):
@@ -555,22 +1425,19 @@ def run_download_worker(job_id, session_token, credentials, max_songs):
                             try:
                                 # Call stored procedure to deduct credits
                                 # Parameters: user_id (IN), job_id (IN), songs_count (IN), success (OUT), error_message (OUT)
-                                cursor.callproc('deduct_credits', [user_id, job_id, songs_downloaded, None, None])
-
-                                # Get OUT parameters (indices 3 and 4 for the OUT parameters)
-                                cursor.execute("SELECT @_deduct_credits_3 AS success, @_deduct_credits_4 AS error_message")
-                                deduct_result = cursor.fetchone()
+                                deduct_result = call_procedure(cursor, 'deduct_credits', [user_id, job_id, songs_downloaded], 2)
 
-                                if deduct_result and deduct_result[0]:  # success = TRUE
-                                    print(f"Credit-based: Deducted {songs_downloaded * 0.35} credits from user {user_id}")
+                                if deduct_result and deduct_result['success']:
+                                    log.info(f"Credit-based: Deducted {songs_downloaded * get_credits_per_song()} credits from user {user_id} "
+                                          f"(new balance: {deduct_result['new_balance']})")
                                 else:
-                                    error_msg = deduct_result[1] if deduct_result else 'Unknown error'
-                                    print(f"Credit deduction failed: {error_msg}")
+                                    error_msg = deduct_result['error_message'] if deduct_result else 'Unknown error'
+                                    log.error(f"Credit deduction failed: {error_msg}")
 
                                 conn.commit()
 
                             except Exception as e:
-                                print(f"Error deducting credits: {e}")
+                                log.error(f"Error deducting credits: {e}")
                                 conn.rollback()
                             finally:
                                 cursor.close()
@@ -585,20 +1452,125 @@ def run_download_worker(job_id, session_token, credentials, max_songs):
                         session['free_credits'] = new_credits
                         session['songs_downloaded'] = session.get('songs_downloaded', 0) + songs_downloaded
 
-                        print(f"Free tier: Deducted {songs_downloaded} credits. " +
+                        log.info(f"Free tier: Deducted {songs_downloaded} credits. " +
                               f"Remaining: {new_credits} (was {current_credits})")
 
             else:
                 download_jobs[job_id]['status'] = 'failed'
                 download_jobs[job_id]['error'] = result.get('error')
 
-        print(f"Download worker completed for job {job_id}: {result}")
+        log.info(f"Download worker completed for job {job_id}: {result}")
 
     except Exception as e:
-        print(f"Download worker error for job {job_id}: {e}")
+        log.error(f"Download worker error for job {job_id}: {e}")
+        if downloader is not None and not release_job_worker(job_id, downloader):
+            return
         if job_id in download_jobs:
             download_jobs[job_id]['status'] = 'failed'
             download_jobs[job_id]['error'] = str(e)
+        publish_job_progress(job_id, {'status': 'failed', 'error_message': str(e)})
+
+# ==================== JOB WATCHDOG ====================
+
+# Workers heartbeat on every progress update, scroll and CDN chunk. A job
+# silent for longer than JOB_STALL_SECONDS (hung Chrome, stalled CDN stream)
+# has its browser and stream killed and is restarted, up to JOB_MAX_ATTEMPTS
+# attempts in total; songs already on disk are kept. A job running longer
+# than JOB_MAX_RUNTIME_SECONDS, counted across all its attempts, is failed
+# outright.
+JOB_STALL_SECONDS = int(os.getenv('JOB_STALL_SECONDS', 180))
+JOB_MAX_RUNTIME_SECONDS = int(os.getenv('JOB_MAX_RUNTIME_SECONDS', 3600))  # 0: no limit
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 2))
+JOB_WATCHDOG_INTERVAL_SECONDS = int(os.getenv('JOB_WATCHDOG_INTERVAL_SECONDS', 15))
+
+job_workers = {}  # job_id -> {'downloader', 'attempt', 'started_at', 'args'} for the running attempt
+                 # (started_at is the job's first attempt, so requeues don't reset the runtime limit)
+job_workers_lock = threading.Lock()
+job_watchdog_started = False
+
+def start_download_worker(job_id, session_token, credentials, max_songs, profile=False, attempt=1, started_at=None):
+    """Run a download job on a background thread, with the watchdog watching it"""
+    ensure_job_watchdog()
+    threading.Thread(
+        target=run_download_worker,
+        args=(job_id, session_token, credentials, max_songs),
+        kwargs={'profile': profile, 'attempt': attempt, 'started_at': started_at or time.monotonic()},
+        daemon=True
+    ).start()
+
+def release_job_worker(job_id, downloader):
+    """Unregister a finished attempt; False if it was reclaimed or cancelled meanwhile"""
+    with job_workers_lock:
+        worker = job_workers.get(job_id)
+        if worker is None or worker['downloader'] is not downloader:
+            return False
+        del job_workers[job_id]
+        return True
+
+def reclaim_job(job_id, worker, reason, retry):
+    """Abort a stuck attempt, then restart the job or mark it failed"""
+    with job_workers_lock:
+        if job_workers.get(job_id) is not worker:
+            return  # Finished in the meantime
+        del job_workers[job_id]
+
+    downloader = worker['downloader']
+    downloader.abort(reason)
+
+    job = download_jobs.get(job_id)
+    retry = retry and job is not None and job['status'] not in JOB_TERMINAL_STATUSES
+    action = 'requeue' if retry else 'fail'
+    inc_counter('hikeyz_jobs_reclaimed_total', (('action', action),))
+    log.warning(f"Watchdog reclaimed job {job_id} ({action}): {reason}", extra={'fields': {
+        'job_id': job_id,
+        'attempt': worker['attempt'],
+        'bytes': downloader.heartbeat['bytes']
+    }})
+
+    if retry:
+        job['status'] = 'queued'
+        publish_job_progress(job_id, {'status': 'queued', 'current_song': 'Restarting stalled download'})
+        start_download_worker(job_id, *worker['args'], attempt=worker['attempt'] + 1,
+                              started_at=worker['started_at'])
+    elif job is not None and job['status'] not in JOB_TERMINAL_STATUSES:
+        job['status'] = 'failed'
+        job['error'] = reason
+        publish_job_progress(job_id, {'status': 'failed', 'error_message': reason})
+
+def check_stalled_jobs():
+    """Reclaim every running attempt past the stall or runtime threshold"""
+    now = time.monotonic()
+    with job_workers_lock:
+        workers = list(job_workers.items())
+
+    for job_id, worker in workers:
+        idle = now - worker['downloader'].heartbeat['at']
+        runtime = now - worker['started_at']
+        if JOB_MAX_RUNTIME_SECONDS and runtime > JOB_MAX_RUNTIME_SECONDS:
+            reclaim_job(job_id, worker, f"Job exceeded {JOB_MAX_RUNTIME_SECONDS}s", retry=False)
+        elif idle > JOB_STALL_SECONDS:
+            reclaim_job(job_id, worker, f"No progress for {idle:.0f}s",
+                        retry=worker['attempt'] < JOB_MAX_ATTEMPTS)
+
+def run_job_watchdog():
+    """Background loop checking running jobs for stalls"""
+    while True:
+        time.sleep(JOB_WATCHDOG_INTERVAL_SECONDS)
+        try:
+            check_stalled_jobs()
+        except Exception as e:
+            log.error(f"Job watchdog error: {e}")
+
+def ensure_job_watchdog():
+    """Start this process's watchdog thread with its first download job"""
+    global job_watchdog_started
+    if job_watchdog_started:
+        return
+
+    with job_workers_lock:
+        if not job_watchdog_started:
+            threading.Thread(target=run_job_watchdog, daemon=True, name='job-watchdog').start()
+            job_watchdog_started = True
 
 @app.route('/api/start-download', methods=['POST'])
 def start_download():
@@ -655,7 +1627,7 @@ def start_download():
                 return jsonify({'error': 'User not found'}), 404
 
             credit_balance = float(user['credit_balance'])
-            credits_per_song = 0.35
+            credits_per_song = get_credits_per_song()
 
             # Check if user has sufficient credits
             if credit_balance < credits_per_song:
@@ -688,7 +1660,7 @@ def start_download():
                     'message': f'You need {credits_required - credit_balance:.2f} more credits to download {max_songs} songs.'
                 }), 403
 
-            print(f"Credit-based download: User {user_id} requesting {max_songs} songs " +
+            log.info(f"Credit-based download: User {user_id} requesting {max_songs} songs " +
                   f"(requires {credits_required} credits, has {credit_balance})")
 
         finally:
@@ -709,7 +1681,7 @@ def start_download():
 
         # Limit downloads to available credits
         max_songs = free_credits
-        print(f"Free tier session: {session_token} has {free_credits} credits available")
+        log.info(f"Free tier session: {session_token} has {free_credits} credits available")
 
     else:
         # Legacy PAID TIER logic (for old time-based plans)
@@ -736,14 +1708,10 @@ def start_download():
         },
         'zip_path': None
     }
+    publish_job_progress(job_id, dict(download_jobs[job_id]['progress'], status='queued'))
 
     # Start download worker in background thread
-    worker_thread = threading.Thread(
-        target=run_download_worker,
-        args=(job_id, session_token, credentials, max_songs),
-        daemon=True
-    )
-    worker_thread.start()
+    start_download_worker(job_id, session_token, credentials, max_songs, profile=should_profile_job())
 
     # Build response based on plan type
     response_data = {
@@ -755,85 +1723,446 @@ def start_download():
 
     # Add credit info for credit-based users
     if plan_type == 'credit':
-        response_data['credits_required'] = max_songs * 0.35
+        response_data['credits_required'] = max_songs * credits_per_song
         response_data['credits_available'] = credit_balance
-        response_data['credits_after'] = credit_balance - (max_songs * 0.35)
+        response_data['credits_after'] = credit_balance - (max_songs * credits_per_song)
         response_data['message'] = 'Download started. Credits will be deducted upon completion.'
 
     return jsonify(response_data)
 
+def apply_progress_to_job(job, progress):
+    """Copy a worker progress snapshot onto the in-memory job record"""
+    job['status'] = progress.get('status', job['status'])
+    job['progress'] = {
+        'total_songs': progress.get('total_songs', 0),
+        'downloaded': progress.get('downloaded', 0),
+        'failed': progress.get('failed', 0),
+        'current_song': progress.get('current_song'),
+        'error_message': progress.get('error_message')
+    }
+
+    # If completed, get zip path
+    if progress.get('status') == 'completed':
+        job['zip_path'] = progress.get('zip_file_path')
+
+def wait_for_job_progress(channel, since, timeout):
+    """Block until the job's progress version passes `since`, it finishes, or timeout"""
+    with channel['cond']:
+        channel['cond'].wait_for(
+            lambda: channel['seq'] > since or channel['state'].get('status') in JOB_TERMINAL_STATUSES,
+            timeout=timeout
+        )
+
 @app.route('/api/job-status/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     """
     Get the status of a download job
-    Reads real-time progress from the progress JSON file
+
+    Progress is versioned per job and returned as an ETag. Requests with a
+    matching If-None-Match get 304 Not Modified. With ?since=<version> the
+    request blocks (up to ?timeout= seconds, capped) until a newer version
+    is published; when PROGRESS_WAIT_MAX_CONCURRENT requests are already
+    waiting it answers at once with the current snapshot.
     """
     if job_id not in download_jobs:
         return jsonify({'error': 'Job not found'}), 404
 
     job = download_jobs[job_id]
+    channel = get_progress_channel(job_id)
 
-    # Try to read progress from file for real-time updates
-    progress_file = f"/Users/Morpheous/vltrndataroom/hitbot-agency/downloads/{job_id}_progress.json"
-    if os.path.exists(progress_file):
+    since = request.args.get('since', type=int)
+    if since is not None and progress_wait_slots.acquire(blocking=False):
         try:
-            with open(progress_file, 'r') as f:
-                file_progress = json.load(f)
-
-            # Update job with latest progress from file
-            job['status'] = file_progress.get('status', job['status'])
-            job['progress'] = {
-                'total_songs': file_progress.get('total_songs', 0),
-                'downloaded': file_progress.get('downloaded', 0),
-                'failed': file_progress.get('failed', 0),
-                'current_song': file_progress.get('current_song'),
-                'error_message': file_progress.get('error_message')
+            timeout = request.args.get('timeout', JOB_STATUS_MAX_WAIT_SECONDS, type=float)
+            wait_for_job_progress(channel, since, max(0, min(timeout, JOB_STATUS_MAX_WAIT_SECONDS)))
+        finally:
+            progress_wait_slots.release()
+
+    with channel['cond']:
+        version = channel['seq']
+        state = dict(channel['state'])
+        cached = channel.get('status_body')
+
+    etag = f"{job_id}-{version}"
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        if cached and cached[0] == version:
+            body = cached[1]
+        else:
+            if state:
+                apply_progress_to_job(job, state)
+            else:
+                # No in-process updates yet: fall back to the worker's progress file
+                progress_file = os.path.join(DOWNLOAD_DIR, f"{job_id}_progress.json")
+                if os.path.exists(progress_file):
+                    try:
+                        with open(progress_file, 'r') as f:
+                            apply_progress_to_job(job, json.load(f))
+                    except Exception as e:
+                        log.error(f"Error reading progress file: {e}")
+
+            body = app.json.dumps({
+                'job_id': job_id,
+                'status': job['status'],
+                'progress': job['progress'],
+                'created_at': job['created_at'],
+                'zip_path': job.get('zip_path'),
+                'version': version
+            })
+            if state:
+                with channel['cond']:
+                    channel['status_body'] = (version, body)
+
+        response = Response(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/job-stream/<job_id>', methods=['GET'])
+def stream_job_status(job_id):
+    """
+    Stream job progress as Server-Sent Events
+
+    The first message is a full snapshot; later messages carry only the
+    fields that changed. Reconnecting clients resume from the Last-Event-ID
+    header (or ?last_event_id=). /api/job-status/<job_id> remains available
+    as a polling fallback, and is what clients should use on a 503 (more than
+    PROGRESS_WAIT_MAX_CONCURRENT streams open).
+    """
+    if job_id not in download_jobs:
+        return jsonify({'error': 'Job not found'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    if not progress_wait_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many progress streams; poll /api/job-status instead'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    try:
+        response = Response(
+            stream_with_context(stream_job_progress(job_id, last_event_id)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Disable proxy buffering
             }
+        )
+    except Exception:
+        progress_wait_slots.release()
+        raise
+    # Released when the server closes the response, even if it was never iterated
+    response.call_on_close(progress_wait_slots.release)
+    return response
+
+# ==================== FILE DELIVERY ====================
+
+# How finished files reach the client:
+# - direct:     Flask streams the file itself (Range/If-Range for resume; gunicorn uses sendfile())
+# - x-accel:    nginx serves it from an internal location mapped to DOWNLOAD_DIR, e.g.
+#                   location /protected-downloads/ { internal; alias /path/to/downloads/; }
+# - x-sendfile: Apache/lighttpd mod_xsendfile serves the absolute path
+# With either proxy mode the API worker is released as soon as the headers are sent.
+FILE_DELIVERY_MODE = os.getenv('FILE_DELIVERY_MODE', 'direct')
+FILE_ACCEL_PREFIX = os.getenv('FILE_ACCEL_PREFIX', '/protected-downloads/')
+
+app.config['USE_X_SENDFILE'] = FILE_DELIVERY_MODE == 'x-sendfile'
+
+def deliver_file(path, download_name, mimetype):
+    """Return a response delivering `path` according to FILE_DELIVERY_MODE"""
+    if FILE_DELIVERY_MODE == 'x-accel':
+        relative = os.path.relpath(os.path.realpath(path), os.path.realpath(DOWNLOAD_DIR))
+        if relative.startswith('..'):
+            raise ValueError('File is outside DOWNLOAD_DIR')
+
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = FILE_ACCEL_PREFIX + quote(relative.replace(os.sep, '/'))
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        response.headers['Cache-Control'] = 'private, no-transform'
+        return response
+
+    # direct and x-sendfile (Flask swaps the body for an X-Sendfile header)
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        # Range, If-Range and ETag for resumed downloads (with X-Sendfile the proxy handles Range)
+        conditional=FILE_DELIVERY_MODE == 'direct',
+        etag=True,
+        max_age=0
+    )
+    response.headers['Cache-Control'] = 'private, no-transform'
+    return response
+
+@app.route('/api/download-file/<job_id>', methods=['GET'])
+def download_file(job_id):
+    """
+    Download the completed ZIP file
+    """
+    if job_id not in download_jobs:
+        return jsonify({'error': 'Job not found'}), 404
+
+    job = download_jobs[job_id]
+
+    if job['status'] != 'completed':
+        return jsonify({'error': 'Job not completed yet'}), 400
+
+    # Get ZIP file path
+    zip_path = job.get('zip_path')
+
+    if not zip_path or not os.path.exists(zip_path):
+        return jsonify({'error': 'Download file not found'}), 404
+
+    # Serve the ZIP file (supports Range requests to resume interrupted downloads)
+    try:
+        return deliver_file(zip_path, f'suno_songs_{job_id}.zip', 'application/zip')
+    except Exception as e:
+        return jsonify({'error': f'Error serving file: {str(e)}'}), 500
+
+# ==================== SIGNED DOWNLOAD URLS ====================
+
+# /files/<path> URLs carry an HMAC over (path, expiry), so any node that shares
+# DOWNLOAD_DIR and the secret can serve them without session or job state.
+# Point DOWNLOAD_URL_BASE at a static file server to move the traffic off the API.
+DOWNLOAD_URL_SECRET = os.getenv('DOWNLOAD_URL_SECRET') or os.getenv('SECRET_KEY') or ''
+DOWNLOAD_URL_TTL_SECONDS = int(os.getenv('DOWNLOAD_URL_TTL_SECONDS', 3600))
+DOWNLOAD_URL_BASE = os.getenv('DOWNLOAD_URL_BASE', '')  # Default: this API's /files route
+
+# A per-process secret would make links fail on every other worker and node,
+# so without a configured one the signed-URL routes are switched off instead
+if not DOWNLOAD_URL_SECRET:
+    log.error("DOWNLOAD_URL_SECRET is not set; signed download URLs and /files are disabled")
 
-            # If completed, get zip path
-            if file_progress.get('status') == 'completed':
-                job['zip_path'] = file_progress.get('zip_file_path')
+def signed_urls_disabled():
+    """503 response for the signed-URL routes when no secret is configured"""
+    return jsonify({'error': 'Signed download links are not configured; use /api/download-file'}), 503
+
+FILE_MIMETYPES = {'.zip': 'application/zip', '.mp3': 'audio/mpeg'}
+
+def download_relpath(path):
+    """Path relative to DOWNLOAD_DIR with forward slashes, or None if outside it"""
+    relative = os.path.relpath(os.path.realpath(path), os.path.realpath(DOWNLOAD_DIR))
+    if relative.startswith('..') or os.path.isabs(relative):
+        return None
+    return relative.replace(os.sep, '/')
+
+def signed_download_url(path):
+    """Signed, expiring URL for a file under DOWNLOAD_DIR"""
+    relative = download_relpath(path)
+    if relative is None:
+        raise ValueError('File is outside DOWNLOAD_DIR')
+    base_url = DOWNLOAD_URL_BASE or request.host_url.rstrip('/') + '/files'
+    return build_signed_url(base_url, DOWNLOAD_URL_SECRET, relative, DOWNLOAD_URL_TTL_SECONDS)
+
+def list_job_songs(song_dir):
+    """Finished songs in a job directory (in-progress downloads are still .part files)"""
+    songs = []
+    if not os.path.isdir(song_dir):
+        return songs
+    for entry in sorted(os.scandir(song_dir), key=lambda entry: entry.name):
+        if entry.name.endswith('.mp3') and entry.is_file():
+            songs.append({
+                'name': entry.name,
+                'size': entry.stat().st_size,
+                'url': signed_download_url(entry.path)
+            })
+    return songs
+
+def job_owner_matches(job, session_token):
+    """True if session_token is the session that started the job"""
+    if not session_token or not isinstance(session_token, str):
+        return False
+    return secrets.compare_digest(str(job.get('session_token', '')).encode('utf-8'), session_token.encode('utf-8'))
+
+@app.route('/api/download-url/<job_id>', methods=['GET'])
+def get_download_urls(job_id):
+    """
+    Issue signed, expiring URLs for a completed job's ZIP and songs
+
+    Query params:
+    - session_token: session that started the job
+    """
+    if not DOWNLOAD_URL_SECRET:
+        return signed_urls_disabled()
+
+    job = download_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if not job_owner_matches(job, request.args.get('session_token', '')):
+        return jsonify({'error': 'Invalid session'}), 401
+
+    if job['status'] != 'completed':
+        return jsonify({'error': 'Job not completed yet'}), 400
+
+    zip_path = job.get('zip_path')
+    if not zip_path or not os.path.exists(zip_path):
+        return jsonify({'error': 'Download file not found'}), 404
+
+    try:
+        songs = list_job_songs(os.path.dirname(zip_path))
+
+        return jsonify({
+            'job_id': job_id,
+            'zip_url': signed_download_url(zip_path),
+            'zip_size': os.path.getsize(zip_path),
+            'songs': songs,
+            'expires_in': DOWNLOAD_URL_TTL_SECONDS
+        })
+    except Exception as e:
+        log.error(f"Signed URL error for job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/files/<path:relpath>', methods=['GET'])
+def serve_signed_file(relpath):
+    """
+    Serve a file from a signed URL (no session or job lookup)
+
+    Query params:
+    - expires: unix time the URL stops working
+    - sig: HMAC signature from /api/download-url
+    """
+    if not DOWNLOAD_URL_SECRET:
+        return signed_urls_disabled()
+
+    if not verify_signed_path(DOWNLOAD_URL_SECRET, relpath, request.args.get('expires'), request.args.get('sig')):
+        return jsonify({'error': 'Invalid or expired link'}), 403
+
+    path = os.path.join(DOWNLOAD_DIR, relpath)
+    if download_relpath(path) != relpath or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+
+    mimetype = FILE_MIMETYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+    try:
+        return deliver_file(path, os.path.basename(path), mimetype)
+    except Exception as e:
+        return jsonify({'error': f'Error serving file: {str(e)}'}), 500
+
+# ==================== EARLY SONG DELIVERY ====================
+
+SUBSET_ZIP_MAX_SONGS = int(os.getenv('SUBSET_ZIP_MAX_SONGS', 500))
+SUBSET_ZIP_MAX_PER_JOB = int(os.getenv('SUBSET_ZIP_MAX_PER_JOB', 5))  # least recently requested are removed
+
+def prune_subset_zips(subset_dir, keep):
+    """Remove the least recently requested subset ZIPs beyond SUBSET_ZIP_MAX_PER_JOB, never keep"""
+    zips = []
+    for entry in os.scandir(subset_dir):
+        if entry.name.endswith('.zip') and entry.path != keep:
+            zips.append((entry.stat().st_mtime, entry.path))
+    zips.sort(reverse=True)
+    for _, path in zips[max(SUBSET_ZIP_MAX_PER_JOB - 1, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@app.route('/api/job-files/<job_id>', methods=['GET'])
+def list_job_files(job_id):
+    """
+    List the songs finished so far, with signed per-song URLs (Range supported)
+
+    Works while the job is still running; poll it alongside job-status.
+
+    Query params:
+    - session_token: session that started the job
+    """
+    if not DOWNLOAD_URL_SECRET:
+        return signed_urls_disabled()
+
+    job = download_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if not job_owner_matches(job, request.args.get('session_token', '')):
+        return jsonify({'error': 'Invalid session'}), 401
+
+    try:
+        songs = list_job_songs(os.path.join(DOWNLOAD_DIR, job_id))
+        return jsonify({
+            'job_id': job_id,
+            'status': job['status'],
+            'songs': songs,
+            'count': len(songs),
+            'expires_in': DOWNLOAD_URL_TTL_SECONDS
+        })
+    except Exception as e:
+        log.error(f"List job files error for job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        except Exception as e:
-            print(f"Error reading progress file: {e}")
+@app.route('/api/job-files/<job_id>/zip', methods=['POST'])
+def build_subset_zip(job_id):
+    """
+    Build a ZIP of selected finished songs and return a signed URL for it
 
-    return jsonify({
-        'job_id': job_id,
-        'status': job['status'],
-        'progress': job['progress'],
-        'created_at': job['created_at'],
-        'zip_path': job.get('zip_path')
-    })
+    Songs are stored uncompressed (MP3 does not deflate), and the same
+    selection reuses the archive already built.
 
-@app.route('/api/download-file/<job_id>', methods=['GET'])
-def download_file(job_id):
-    """
-    Download the completed ZIP file
+    Request body:
+    {
+        "session_token": "token_here",
+        "songs": ["001_Title_abcd1234.mp3", "004_Other_ef567890.mp3"]
+    }
     """
-    if job_id not in download_jobs:
-        return jsonify({'error': 'Job not found'}), 404
-
-    job = download_jobs[job_id]
+    if not DOWNLOAD_URL_SECRET:
+        return signed_urls_disabled()
 
-    if job['status'] != 'completed':
-        return jsonify({'error': 'Job not completed yet'}), 400
+    data = request.get_json() or {}
+    job = download_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
 
-    # Get ZIP file path
-    zip_path = job.get('zip_path')
+    if not job_owner_matches(job, data.get('session_token', '')):
+        return jsonify({'error': 'Invalid session'}), 401
 
-    if not zip_path or not os.path.exists(zip_path):
-        return jsonify({'error': 'Download file not found'}), 404
+    names = data.get('songs')
+    if not isinstance(names, list) or not names:
+        return jsonify({'error': 'songs must be a non-empty list'}), 400
+    if not all(isinstance(name, str) for name in names):
+        return jsonify({'error': 'songs must be file names'}), 400
+    if len(names) > SUBSET_ZIP_MAX_SONGS:
+        return jsonify({'error': f'At most {SUBSET_ZIP_MAX_SONGS} songs per ZIP'}), 400
 
-    # Serve the ZIP file
     try:
-        return send_file(
-            zip_path,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'suno_songs_{job_id}.zip'
-        )
+        song_dir = os.path.join(DOWNLOAD_DIR, job_id)
+        available = {song['name'] for song in list_job_songs(song_dir)}
+        selected = sorted(set(names))
+        missing = [name for name in selected if name not in available]
+        if missing:
+            return jsonify({'error': 'Songs not available', 'missing': missing}), 404
+
+        digest = hashlib.sha256('\n'.join(selected).encode('utf-8')).hexdigest()[:16]
+        subset_dir = os.path.join(song_dir, 'subsets')
+        zip_path = os.path.join(subset_dir, f"{job_id}_{digest}.zip")
+
+        if not os.path.exists(zip_path):
+            os.makedirs(subset_dir, exist_ok=True)
+            partial_path = f"{zip_path}.{secrets.token_hex(4)}.part"
+            with zipfile.ZipFile(partial_path, 'w', zipfile.ZIP_STORED) as zipf:
+                for name in selected:
+                    zipf.write(os.path.join(song_dir, name), name)
+            os.replace(partial_path, zip_path)
+        else:
+            os.utime(zip_path)
+        prune_subset_zips(subset_dir, zip_path)
+
+        return jsonify({
+            'job_id': job_id,
+            'zip_url': signed_download_url(zip_path),
+            'zip_size': os.path.getsize(zip_path),
+            'song_count': len(selected),
+            'expires_in': DOWNLOAD_URL_TTL_SECONDS
+        })
     except Exception as e:
-        return jsonify({'error': f'Error serving file: {str(e)}'}), 500
+        log.error(f"Subset ZIP error for job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/cancel-job/<job_id>', methods=['POST'])
 def cancel_job(job_id):
@@ -849,15 +2178,150 @@ def cancel_job(job_id):
         return jsonify({'error': 'Cannot cancel job in current state'}), 400
 
     job['status'] = 'cancelled'
+    publish_job_progress(job_id, {'status': 'cancelled'})
+
+    # Stop the running attempt; with it unregistered, its result is discarded
+    with job_workers_lock:
+        worker = job_workers.pop(job_id, None)
+    if worker is not None:
+        worker['downloader'].abort('Cancelled')
 
     return jsonify({
         'message': 'Job cancelled',
         'job_id': job_id
     })
 
+# ==================== RATE LIMITING ====================
+
+# Token buckets in a local SQLite file, shared by every gunicorn worker on the
+# host. Limits are "count/seconds": a bucket holds up to `count` tokens and
+# refills at count/seconds per second. Checks run before the handler, so a
+# rejected request never reaches MySQL or bcrypt.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', '/tmp/hikeyz-ratelimit.sqlite3')
+RATE_LIMIT_LOGIN_IP = os.getenv('RATE_LIMIT_LOGIN_IP', '20/60')
+RATE_LIMIT_LOGIN_EMAIL = os.getenv('RATE_LIMIT_LOGIN_EMAIL', '5/60')
+RATE_LIMIT_REGISTER_IP = os.getenv('RATE_LIMIT_REGISTER_IP', '5/3600')
+RATE_LIMIT_FREE_SESSION_IP = os.getenv('RATE_LIMIT_FREE_SESSION_IP', '3/3600')
+RATE_LIMIT_AD_START_SESSION = os.getenv('RATE_LIMIT_AD_START_SESSION', '10/600')
+RATE_LIMIT_AD_START_IP = os.getenv('RATE_LIMIT_AD_START_IP', '30/600')
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))  # Proxies that append to X-Forwarded-For
+
+# take_token needs UPSERT ... RETURNING; without it every check would fail open
+if RATE_LIMIT_ENABLED and sqlite3.sqlite_version_info < (3, 35, 0):
+    log.warning(f"SQLite {sqlite3.sqlite_version} is older than 3.35 (no RETURNING); rate limiting is disabled")
+    RATE_LIMIT_ENABLED = False
+
+rate_limit_local = threading.local()  # One SQLite connection per thread
+
+def parse_rate_limit(spec):
+    """'5/60' -> (capacity 5, refill 5/60 tokens per second)"""
+    count, _, seconds = spec.partition('/')
+    return float(count), float(count) / float(seconds or 1)
+
+def get_rate_limit_db():
+    """Return this thread's connection to the rate-limit store"""
+    conn = getattr(rate_limit_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(RATE_LIMIT_DB, timeout=1, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            )
+        """)
+        rate_limit_local.conn = conn
+    return conn
+
+def take_token(bucket, capacity, refill_rate):
+    """
+    Take one token from a bucket in a single atomic statement
+
+    Returns (allowed, retry_after_seconds). Fails open if the store is unavailable.
+    """
+    now = time.time()
+    try:
+        conn = get_rate_limit_db()
+        row = conn.execute("""
+            INSERT INTO rate_buckets (bucket, tokens, updated_at, allowed)
+            VALUES (:bucket, :capacity - 1, :now, 1)
+            ON CONFLICT(bucket) DO UPDATE SET
+                allowed = MIN(:capacity, tokens + (:now - updated_at) * :rate) >= 1,
+                tokens = MIN(:capacity, tokens + (:now - updated_at) * :rate)
+                         - (MIN(:capacity, tokens + (:now - updated_at) * :rate) >= 1),
+                updated_at = :now
+            RETURNING allowed, tokens
+        """, {'bucket': bucket, 'capacity': capacity, 'now': now, 'rate': refill_rate}).fetchone()
+
+        # Occasionally drop buckets that have been full long enough to be forgotten
+        if secrets.randbelow(1000) == 0:
+            conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - 86400,))
+    except sqlite3.Error as e:
+        log.warning(f"Rate limit store error: {e}")
+        return True, 0
+
+    allowed, tokens = row
+    if allowed:
+        return True, 0
+    return False, max(1, int((1 - tokens) / refill_rate + 0.999))
+
+def client_ip():
+    """Client address, taken from X-Forwarded-For behind TRUSTED_PROXY_HOPS proxies"""
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr or 'unknown'
+
+def rate_limited(*rules):
+    """
+    Decorator applying token-bucket limits before the handler runs
+
+    Each rule is (name, limit_spec, key_func); key_func receives the parsed
+    JSON body and returns the bucket key, or None to skip that rule.
+    """
+    parsed = [(name, parse_rate_limit(spec), key_func) for name, spec, key_func in rules]
+
+    def decorator(handler):
+        if not RATE_LIMIT_ENABLED:
+            return handler
+
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True) or {}
+            for name, (capacity, refill_rate), key_func in parsed:
+                key = key_func(data)
+                if not key:
+                    continue
+                allowed, retry_after = take_token(f"{name}:{key}", capacity, refill_rate)
+                if not allowed:
+                    inc_counter('hikeyz_rate_limited_total', (('rule', name),))
+                    response = jsonify({'error': 'Too many requests. Please try again later.',
+                                        'retry_after': retry_after})
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+            return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def by_ip(data):
+    return client_ip()
+
+def by_email(data):
+    email = data.get('email')
+    return email.strip().lower()[:255] if isinstance(email, str) and email.strip() else None
+
+def by_session(data):
+    token = data.get('session_token')
+    return token[:128] if isinstance(token, str) and token else None
+
 # ==================== CREDIT-BASED USER ACCOUNT ENDPOINTS ====================
 
 @app.route('/api/users/register', methods=['POST'])
+@rate_limited(('register_ip', RATE_LIMIT_REGISTER_IP, by_ip))
 def register_user():
     """
     Register a new user with email + PIN
@@ -907,7 +2371,7 @@ def register_user():
             conn.commit()
             user_id = cursor.lastrowid
 
-            print(f"New user registered: {email} (ID: {user_id})")
+            log.info(f"New user registered: {email} (ID: {user_id})")
 
             return jsonify({
                 'success': True,
@@ -921,12 +2385,15 @@ def register_user():
             cursor.close()
             conn.close()
 
+    except PinHasherBusy:
+        return pin_busy_response()
     except Exception as e:
-        print(f"Registration error: {e}")
+        log.error(f"Registration error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/users/login', methods=['POST'])
+@rate_limited(('login_ip', RATE_LIMIT_LOGIN_IP, by_ip), ('login_email', RATE_LIMIT_LOGIN_EMAIL, by_email))
 def login_user():
     """
     Login user with email + PIN
@@ -974,11 +2441,26 @@ def login_user():
             if not verify_pin(pin, user['pin_hash']):
                 return jsonify({'error': 'Invalid email or PIN'}), 401
 
+            # Transparently upgrade the hash if BCRYPT_ROUNDS changed
+            # (skipped when the hashing pool is busy; retried on next login)
+            new_pin_hash = None
+            if pin_needs_rehash(user['pin_hash']):
+                try:
+                    new_pin_hash = hash_pin(pin)
+                except PinHasherBusy:
+                    pass
+
             # Update last login
-            cursor.execute("""
-                UPDATE users SET last_login_at = NOW()
-                WHERE id = %s
-            """, (user['id'],))
+            if new_pin_hash:
+                cursor.execute("""
+                    UPDATE users SET last_login_at = NOW(), pin_hash = %s
+                    WHERE id = %s
+                """, (new_pin_hash, user['id']))
+            else:
+                cursor.execute("""
+                    UPDATE users SET last_login_at = NOW()
+                    WHERE id = %s
+                """, (user['id'],))
             conn.commit()
 
             # Create session token
@@ -995,10 +2477,10 @@ def login_user():
             }
 
             # Calculate songs available
-            credits_per_song = 0.35
-            songs_available = int(user['credit_balance'] / credits_per_song)
+            credits_per_song = get_credits_per_song()
+            songs_available = int(float(user['credit_balance']) / credits_per_song)
 
-            print(f"User logged in: {email} (ID: {user['id']})")
+            log.info(f"User logged in: {email} (ID: {user['id']})")
 
             return jsonify({
                 'success': True,
@@ -1015,8 +2497,10 @@ def login_user():
             cursor.close()
             conn.close()
 
+    except PinHasherBusy:
+        return pin_busy_response()
     except Exception as e:
-        print(f"Login error: {e}")
+        log.error(f"Login error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1069,8 +2553,8 @@ def get_user_balance():
                 return jsonify({'error': 'User not found'}), 404
 
             # Calculate songs available
-            credits_per_song = 0.35
-            songs_available = int(user['credit_balance'] / credits_per_song)
+            credits_per_song = get_credits_per_song()
+            songs_available = int(float(user['credit_balance']) / credits_per_song)
 
             return jsonify({
                 'email': user['email'],
@@ -1086,7 +2570,7 @@ def get_user_balance():
             conn.close()
 
     except Exception as e:
-        print(f"Balance check error: {e}")
+        log.error(f"Balance check error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1094,50 +2578,215 @@ def get_user_balance():
 def get_credit_packages():
     """
     Get available credit packages
+    Served from the catalog cache; MySQL is only hit when the TTL expires
     """
     try:
-        # Connect to database
-        conn = get_db_connection()
-        if not conn:
+        packages = get_cached_catalog('credit_packages', load_credit_packages)
+        if packages is None:
             return jsonify({'error': 'Database connection failed'}), 500
 
-        cursor = conn.cursor(dictionary=True)
+        # Calculate estimated songs for each package
+        credits_per_song = get_credits_per_song()
+        packages = [
+            dict(package, estimated_songs=int(package['total_credits'] / credits_per_song))
+            for package in packages
+        ]
 
-        try:
-            # Get active packages
-            cursor.execute("""
-                SELECT id, package_name, usd_amount, base_credits,
-                       bonus_credits, total_credits
-                FROM credit_packages
-                WHERE is_active = TRUE
-                ORDER BY display_order
-            """)
+        return jsonify({
+            'packages': packages
+        })
 
-            packages = cursor.fetchall()
+    except Exception as e:
+        log.error(f"Get packages error: {e}")
+        return jsonify({'error': str(e)}), 500
 
-            # Calculate estimated songs for each package
-            credits_per_song = 0.35
-            for package in packages:
-                package['usd_amount'] = float(package['usd_amount'])
-                package['base_credits'] = float(package['base_credits'])
-                package['bonus_credits'] = float(package['bonus_credits'])
-                package['total_credits'] = float(package['total_credits'])
-                package['estimated_songs'] = int(package['total_credits'] / credits_per_song)
 
-            return jsonify({
-                'packages': packages
-            })
+@app.route('/api/credits/cache/invalidate', methods=['POST'])
+def invalidate_credit_catalog():
+    """
+    Invalidate cached credit packages / pricing config after editing them in the DB
+    (requires "Authorization: Bearer <ADMIN_API_TOKEN>")
 
-        finally:
-            cursor.close()
-            conn.close()
+    Only the cache of the process that handles this request is cleared; the
+    others pick up the change when their entries expire, at most
+    CATALOG_CACHE_TTL_SECONDS later.
+
+    Request body:
+    {
+        "catalog": "credit_packages"  // Optional: credit_packages or pricing_config (default: both)
+    }
+    """
+    try:
+        if not admin_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        data = request.get_json(silent=True) or {}
+        catalog = data.get('catalog')
+
+        if catalog not in (None, 'credit_packages', 'pricing_config'):
+            return jsonify({'error': 'Unknown catalog'}), 400
+
+        invalidate_catalog_cache(catalog)
+
+        return jsonify({
+            'success': True,
+            'invalidated': catalog or 'all',
+            'scope': 'process',
+            'other_processes_stale_for_seconds': CATALOG_CACHE_TTL_SECONDS
+        })
 
     except Exception as e:
-        print(f"Get packages error: {e}")
+        log.error(f"Invalidate catalog error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+# ==================== IDEMPOTENCY KEYS ====================
+
+# Money endpoints accept an Idempotency-Key header. The first request with a
+# key stores its fingerprint and response; repeats within the window get the
+# stored response back without calling the stored procedures again.
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+def idempotency_fingerprint(endpoint, data):
+    """Hash of the endpoint and request body (minus the session token)"""
+    body = {key: value for key, value in (data or {}).items() if key != 'session_token'}
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{endpoint}:{canonical}".encode('utf-8')).hexdigest()
+
+def reserve_idempotency_key(user_id, key, endpoint, fingerprint):
+    """
+    Reserve a key before running the handler
+
+    Returns None once the key is reserved for this request, or the response
+    to send instead (stored replay, 409, 422 or a database error).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT request_fingerprint, response_status, response_body,
+                   expires_at < NOW() AS expired
+            FROM idempotency_keys
+            WHERE user_id = %s AND idempotency_key = %s
+        """, (user_id, key))
+        existing = cursor.fetchone()
+
+        if existing and not existing['expired']:
+            if existing['request_fingerprint'] != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+            if existing['response_status'] is None:
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+
+            response = app.response_class(
+                existing['response_body'],
+                status=existing['response_status'],
+                mimetype='application/json'
+            )
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        if existing:
+            cursor.execute("""
+                DELETE FROM idempotency_keys
+                WHERE user_id = %s AND idempotency_key = %s
+            """, (user_id, key))
+
+        cursor.execute("""
+            INSERT IGNORE INTO idempotency_keys
+                (user_id, idempotency_key, endpoint, request_fingerprint, expires_at)
+            VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s HOUR)
+        """, (user_id, key, endpoint, fingerprint, IDEMPOTENCY_KEY_TTL_HOURS))
+        conn.commit()
+
+        if cursor.rowcount != 1:
+            return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+
+        return None
+
+    finally:
+        cursor.close()
+        conn.close()
+
+def complete_idempotency_key(user_id, key, response):
+    """
+    Store the handler's response for replays, or release the reservation
+    (response None: the handler raised; 5xx: not stored) so the client can retry
+    """
+    conn = get_db_connection()
+    if not conn:
+        log.error(f"Could not complete Idempotency-Key {key} for user {user_id}: database connection failed")
+        return
+
+    cursor = conn.cursor()
+
+    try:
+        if response is None or response.status_code >= 500:
+            cursor.execute("""
+                DELETE FROM idempotency_keys
+                WHERE user_id = %s AND idempotency_key = %s
+            """, (user_id, key))
+        else:
+            cursor.execute("""
+                UPDATE idempotency_keys
+                SET response_status = %s, response_body = %s
+                WHERE user_id = %s AND idempotency_key = %s
+            """, (response.status_code, response.get_data(as_text=True), user_id, key))
+        conn.commit()
+
+    except Error as e:
+        log.error(f"Could not complete Idempotency-Key {key} for user {user_id}: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+def idempotent(endpoint):
+    """
+    Decorator making a POST handler safe to retry with an Idempotency-Key header
+
+    - Same key + same body: the stored response is replayed
+    - Same key + different body: 422
+    - Same key while the first request is still running: 409
+    Requests without the header, or without a valid session, pass straight through.
+    5xx responses and handler exceptions release the key, so the client can retry.
+    No connection is held while the handler runs.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            data = request.get_json(silent=True) or {}
+            session = active_sessions.get(data.get('session_token'))
+            user_id = session.get('user_id') if session else None
+
+            if not key or not user_id:
+                return handler(*args, **kwargs)
+
+            if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+            blocked = reserve_idempotency_key(user_id, key, endpoint, idempotency_fingerprint(endpoint, data))
+            if blocked is not None:
+                return blocked
+
+            try:
+                response = app.make_response(handler(*args, **kwargs))
+            except Exception:
+                complete_idempotency_key(user_id, key, None)
+                raise
+
+            complete_idempotency_key(user_id, key, response)
+            return response
+
+        return wrapper
+    return decorator
+
 @app.route('/api/credits/purchase', methods=['POST'])
+@idempotent('credits_purchase')
 def purchase_credits():
     """
     Purchase credits with E9th token or other payment method
@@ -1150,6 +2799,8 @@ def purchase_credits():
         "tx_hash": "0xabc123...",
         "wallet_address": "0x742d35Cc..."
     }
+
+    Optional header: Idempotency-Key (safe client retries)
     """
     try:
         data = request.get_json()
@@ -1179,12 +2830,7 @@ def purchase_credits():
             # If payment method is e9th_stablecoin, use the e9th deposit procedure
             if payment_method == 'e9th_stablecoin' and tx_hash and wallet_address:
                 # Get package details first to get e9th amount
-                cursor.execute("""
-                    SELECT package_name, usd_amount, base_credits, bonus_credits, total_credits
-                    FROM credit_packages
-                    WHERE id = %s
-                """, (package_id,))
-                package = cursor.fetchone()
+                package = get_credit_package(package_id, include_inactive=True)
                 
                 if not package:
                     return jsonify({'error': 'Invalid package'}), 400
@@ -1193,32 +2839,21 @@ def purchase_credits():
                 e9th_amount = float(package['total_credits'])
                 
                 # Call process_e9th_deposit procedure
-                cursor.callproc('process_e9th_deposit', [
+                result = call_procedure(cursor, 'process_e9th_deposit', [
                     user_id,
                     e9th_amount,
                     tx_hash,
                     wallet_address,
-                    package_id,
-                    None,  # OUT: success
-                    None,  # OUT: error_message
-                    None   # OUT: credits_issued
-                ])
-                
-                # Get OUT parameters
-                cursor.execute("SELECT @_process_e9th_deposit_5 AS success, @_process_e9th_deposit_6 AS error_message, @_process_e9th_deposit_7 AS credits_issued")
-                result = cursor.fetchone()
+                    package_id
+                ], 3)
                 
                 if not result or not result.get('success'):
                     error_msg = result.get('error_message', 'Purchase failed') if result else 'Purchase failed'
                     conn.rollback()
                     return jsonify({'error': error_msg}), 400
                 
-                credits_issued = float(result.get('credits_issued', 0))
-                
-                # Get new balance
-                cursor.execute("SELECT credit_balance FROM users WHERE id = %s", (user_id,))
-                user = cursor.fetchone()
-                new_balance = float(user['credit_balance'])
+                credits_issued = float(result['credits_issued'] or 0)
+                new_balance = float(result['new_balance'] or 0)
                 
                 conn.commit()
                 
@@ -1236,37 +2871,23 @@ def purchase_credits():
                 })
             else:
                 # Use standard add_credits procedure for other payment methods
-                cursor.callproc('add_credits', [user_id, package_id, payment_method, tx_hash, None, None])
-
-                # Get OUT parameters (indices 4 and 5 for the OUT parameters)
-                cursor.execute("SELECT @_add_credits_4 AS success, @_add_credits_5 AS error_message")
-                result = cursor.fetchone()
+                result = call_procedure(cursor, 'add_credits', [user_id, package_id, payment_method, tx_hash], 2)
 
                 if not result or not result.get('success'):
                     error_msg = result.get('error_message', 'Purchase failed') if result else 'Purchase failed'
                     conn.rollback()
                     return jsonify({'error': error_msg}), 400
 
-                # Get package details
-                cursor.execute("""
-                    SELECT package_name, usd_amount, base_credits, bonus_credits, total_credits
-                    FROM credit_packages
-                    WHERE id = %s
-                """, (package_id,))
-
-                package = cursor.fetchone()
-
-                # Get new balance
-                cursor.execute("""
-                    SELECT credit_balance FROM users WHERE id = %s
-                """, (user_id,))
+                if result.get('error_message') == 'Already credited':
+                    return jsonify({'error': 'This transaction has already been credited'}), 409
 
-                user = cursor.fetchone()
-                new_balance = float(user['credit_balance'])
+                # Get package details
+                package = get_credit_package(package_id, include_inactive=True)
+                new_balance = float(result['new_balance'] or 0)
 
                 conn.commit()
 
-            print(f"Credits purchased: User {user_id}, Package {package_id}, Amount {package['total_credits']}")
+            log.info(f"Credits purchased: User {user_id}, Package {package_id}, Amount {package['total_credits']}")
 
             return jsonify({
                 'success': True,
@@ -1284,10 +2905,11 @@ def purchase_credits():
             conn.close()
 
     except Exception as e:
-        print(f"Purchase credits error: {e}")
+        log.error(f"Purchase credits error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/e9th/deposit', methods=['POST'])
+@idempotent('e9th_deposit')
 def process_e9th_deposit():
     """
     Process e9th token deposit and issue credits
@@ -1300,6 +2922,8 @@ def process_e9th_deposit():
         "wallet_address": "0x742d35Cc...",
         "package_id": 1  // Optional: if depositing for a specific package
     }
+
+    Optional header: Idempotency-Key (safe client retries)
     """
     try:
         data = request.get_json()
@@ -1327,36 +2951,25 @@ def process_e9th_deposit():
 
         try:
             # Call stored procedure to process e9th deposit
-            cursor.callproc('process_e9th_deposit', [
+            result = call_procedure(cursor, 'process_e9th_deposit', [
                 user_id, 
                 float(e9th_amount), 
                 tx_hash, 
                 wallet_address, 
-                package_id,
-                None,  # OUT: success
-                None,  # OUT: error_message
-                None   # OUT: credits_issued
-            ])
-
-            # Get OUT parameters
-            cursor.execute("SELECT @_process_e9th_deposit_5 AS success, @_process_e9th_deposit_6 AS error_message, @_process_e9th_deposit_7 AS credits_issued")
-            result = cursor.fetchone()
+                package_id
+            ], 3)
 
             if not result or not result.get('success'):
                 error_msg = result.get('error_message', 'Deposit failed') if result else 'Deposit failed'
                 conn.rollback()
                 return jsonify({'error': error_msg}), 400
 
-            credits_issued = float(result.get('credits_issued', 0))
-
-            # Get new balance
-            cursor.execute("SELECT credit_balance FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            new_balance = float(user['credit_balance'])
+            credits_issued = float(result['credits_issued'] or 0)
+            new_balance = float(result['new_balance'] or 0)
 
             conn.commit()
 
-            print(f"E9th deposit processed: User {user_id}, Amount {e9th_amount} e9th, Credits issued: {credits_issued}")
+            log.info(f"E9th deposit processed: User {user_id}, Amount {e9th_amount} e9th, Credits issued: {credits_issued}")
 
             return jsonify({
                 'success': True,
@@ -1369,30 +2982,40 @@ def process_e9th_deposit():
 
         except Exception as e:
             conn.rollback()
-            print(f"E9th deposit error: {e}")
+            log.error(f"E9th deposit error: {e}")
             return jsonify({'error': str(e)}), 500
         finally:
             cursor.close()
             conn.close()
 
     except Exception as e:
-        print(f"Process e9th deposit error: {e}")
+        log.error(f"Process e9th deposit error: {e}")
         return jsonify({'error': str(e)}), 500
 
+E9TH_COLLECTIONS_MAX_PAGE_SIZE = 200
+
 @app.route('/api/e9th/collections', methods=['GET'])
 def get_e9th_collections():
     """
-    Get e9th token collections (admin or user-specific)
-    
+    Get e9th token collections (admin or user-specific), newest first
+
     Query params:
     - session_token: Required for user-specific collections
     - status: Filter by status (pending, collected, transferred, failed)
-    - limit: Number of records to return (default: 100)
+    - limit: Number of records to return (default: 100, max: 200)
+    - cursor: next_cursor from the previous page
     """
     try:
         session_token = request.args.get('session_token')
         status_filter = request.args.get('status')
-        limit = int(request.args.get('limit', 100))
+        limit = max(1, min(request.args.get('limit', 100, type=int), E9TH_COLLECTIONS_MAX_PAGE_SIZE))
+        page_cursor = request.args.get('cursor')
+
+        if page_cursor:
+            try:
+                cursor_collected_at, cursor_id = decode_page_cursor(page_cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
 
         conn = get_db_connection()
         if not conn:
@@ -1401,6 +3024,8 @@ def get_e9th_collections():
         cursor = conn.cursor(dictionary=True)
 
         try:
+            # Each filter combination is served by a composite index ending in
+            # (collected_at, id), so rows come back pre-sorted without a filesort
             query = """
                 SELECT 
                     ec.id,
@@ -1433,12 +3058,25 @@ def get_e9th_collections():
                 query += " AND ec.collection_status = %s"
                 params.append(status_filter)
 
-            query += " ORDER BY ec.collected_at DESC LIMIT %s"
-            params.append(limit)
+            # Resume after the last row of the previous page
+            if page_cursor:
+                query += " AND (ec.collected_at < %s OR (ec.collected_at = %s AND ec.id < %s))"
+                params.extend([cursor_collected_at, cursor_collected_at, cursor_id])
+
+            query += " ORDER BY ec.collected_at DESC, ec.id DESC LIMIT %s"
+            params.append(limit + 1)
 
             cursor.execute(query, params)
             collections = cursor.fetchall()
 
+            has_more = len(collections) > limit
+            collections = collections[:limit]
+
+            next_cursor = None
+            if has_more:
+                last = collections[-1]
+                next_cursor = encode_page_cursor(last['collected_at'], last['id'])
+
             # Convert Decimal to float for JSON serialization
             for collection in collections:
                 collection['credits_used'] = float(collection['credits_used'])
@@ -1447,7 +3085,49 @@ def get_e9th_collections():
             return jsonify({
                 'success': True,
                 'collections': collections,
-                'count': len(collections)
+                'count': len(collections),
+                'next_cursor': next_cursor,
+                'has_more': has_more
+            })
+
+        finally:
+            cursor.close()
+            conn.close()
+
+    except Exception as e:
+        log.error(f"Get e9th collections error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+E9TH_TRANSFER_CHUNK_SIZE = 1000  # Collections claimed per transfer by default
+E9TH_TRANSFER_MAX_CHUNK_SIZE = 10000
+
+@app.route('/api/e9th/pending-total', methods=['GET'])
+def get_e9th_pending_total():
+    """
+    Get the running total of collected e9th tokens awaiting transfer
+
+    Reads the incrementally maintained e9th_pending_totals rows rather than
+    summing e9th_collections.
+    """
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            cursor.execute("""
+                SELECT COALESCE(SUM(pending_tokens), 0) AS pending_tokens,
+                       COALESCE(SUM(pending_count), 0) AS pending_count
+                FROM e9th_pending_totals
+            """)
+            totals = cursor.fetchone()
+
+            return jsonify({
+                'success': True,
+                'pending_tokens': float(totals['pending_tokens']),
+                'pending_count': int(totals['pending_count'])
             })
 
         finally:
@@ -1455,33 +3135,37 @@ def get_e9th_collections():
             conn.close()
 
     except Exception as e:
-        print(f"Get e9th collections error: {e}")
+        log.error(f"Get e9th pending total error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/e9th/transfer', methods=['POST'])
 def transfer_collected_e9th():
     """
     Transfer collected e9th tokens to receiving wallet
+    (requires "Authorization: Bearer <ADMIN_API_TOKEN>")
     
     Request body:
     {
-        "session_token": "usr_abc123...",  // Admin session required
-        "receiving_wallet_id": 1  // Optional: defaults to active wallet
+        "receiving_wallet_id": 1,  // Optional: defaults to active wallet
+        "chunk_size": 1000  // Optional: max collections in this transfer (oldest first)
     }
     
     Note: This endpoint should be called by an admin or automated system
-    to transfer collected tokens to the receiving wallet.
+    to transfer collected tokens to the receiving wallet. Each call moves at
+    most chunk_size collections; repeat while has_more is true.
     """
     try:
-        data = request.get_json()
-        session_token = data.get('session_token')
-        receiving_wallet_id = data.get('receiving_wallet_id', 1)  # Default to wallet ID 1
+        if not admin_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
 
-        if not session_token or session_token not in active_sessions:
-            return jsonify({'error': 'Invalid session token'}), 401
+        data = request.get_json(silent=True) or {}
+        receiving_wallet_id = data.get('receiving_wallet_id', 1)  # Default to wallet ID 1
 
-        # TODO: Add admin check here
-        # For now, allow any authenticated user (should be restricted to admin)
+        try:
+            chunk_size = int(data.get('chunk_size', E9TH_TRANSFER_CHUNK_SIZE))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'chunk_size must be an integer'}), 400
+        chunk_size = max(1, min(chunk_size, E9TH_TRANSFER_MAX_CHUNK_SIZE))
 
         conn = get_db_connection()
         if not conn:
@@ -1491,41 +3175,32 @@ def transfer_collected_e9th():
 
         try:
             # Call stored procedure to transfer collected tokens
-            cursor.callproc('transfer_collected_e9th', [
-                receiving_wallet_id,
-                None,  # OUT: success
-                None,  # OUT: error_message
-                None,  # OUT: transfer_id
-                None   # OUT: total_transferred
-            ])
-
-            # Get OUT parameters
-            cursor.execute("SELECT @_transfer_collected_e9th_2 AS success, @_transfer_collected_e9th_3 AS error_message, @_transfer_collected_e9th_4 AS transfer_id, @_transfer_collected_e9th_5 AS total_transferred")
-            result = cursor.fetchone()
+            result = call_procedure(cursor, 'transfer_collected_e9th_chunk', [receiving_wallet_id, chunk_size], 4)
 
             if not result or not result.get('success'):
                 error_msg = result.get('error_message', 'Transfer failed') if result else 'Transfer failed'
                 conn.rollback()
                 return jsonify({'error': error_msg}), 400
 
-            transfer_id = result.get('transfer_id')
-            total_transferred = float(result.get('total_transferred', 0))
-
-            # Get receiving wallet address
-            cursor.execute("SELECT wallet_address, wallet_name FROM e9th_receiving_wallets WHERE id = %s", (receiving_wallet_id,))
-            wallet = cursor.fetchone()
+            transfer_id = result['transfer_id']
+            total_transferred = float(result['total_transferred'] or 0)
+            wallet = {'wallet_address': result['wallet_address'], 'wallet_name': result['wallet_name']}
 
             # Update transfer status to 'processing' (actual blockchain transfer happens externally)
             cursor.execute("UPDATE e9th_transfers SET transfer_status = 'processing' WHERE id = %s", (transfer_id,))
 
             conn.commit()
 
-            print(f"E9th transfer initiated: Transfer ID {transfer_id}, Amount {total_transferred} e9th tokens")
+            log.info(f"E9th transfer initiated: Transfer ID {transfer_id}, Amount {total_transferred} e9th tokens "
+                  f"({result['collection_count']} collections, {result['remaining_count']} remaining)")
 
             return jsonify({
                 'success': True,
                 'transfer_id': transfer_id,
                 'total_tokens_transferred': total_transferred,
+                'collection_count': result['collection_count'],
+                'remaining_tokens': float(result['remaining_tokens'] or 0),
+                'has_more': int(result['remaining_count'] or 0) > 0,
                 'receiving_wallet': wallet['wallet_address'],
                 'wallet_name': wallet['wallet_name'],
                 'status': 'processing',
@@ -1534,14 +3209,14 @@ def transfer_collected_e9th():
 
         except Exception as e:
             conn.rollback()
-            print(f"E9th transfer error: {e}")
+            log.error(f"E9th transfer error: {e}")
             return jsonify({'error': str(e)}), 500
         finally:
             cursor.close()
             conn.close()
 
     except Exception as e:
-        print(f"Transfer collected e9th error: {e}")
+        log.error(f"Transfer collected e9th error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/e9th/transfer/complete', methods=['POST'])
@@ -1604,7 +3279,7 @@ def complete_e9th_transfer():
 
             conn.commit()
 
-            print(f"E9th transfer completed: Transfer ID {transfer_id}, TX Hash {tx_hash}")
+            log.info(f"E9th transfer completed: Transfer ID {transfer_id}, TX Hash {tx_hash}")
 
             return jsonify({
                 'success': True,
@@ -1615,14 +3290,14 @@ def complete_e9th_transfer():
 
         except Exception as e:
             conn.rollback()
-            print(f"Complete e9th transfer error: {e}")
+            log.error(f"Complete e9th transfer error: {e}")
             return jsonify({'error': str(e)}), 500
         finally:
             cursor.close()
             conn.close()
 
     except Exception as e:
-        print(f"Complete e9th transfer error: {e}")
+        log.error(f"Complete e9th transfer error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/e9th/receiving-wallet', methods=['GET', 'POST'])
@@ -1722,27 +3397,45 @@ def manage_receiving_wallet():
             conn.close()
 
     except Exception as e:
-        print(f"Manage receiving wallet error: {e}")
+        log.error(f"Manage receiving wallet error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+TRANSACTIONS_MAX_PAGE_SIZE = 100
+
+def encode_page_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset position as an opaque cursor string"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(cursor):
+    """Decode a cursor from encode_page_cursor (raises ValueError if malformed)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
 @app.route('/api/users/transactions', methods=['POST'])
 def get_user_transactions():
     """
-    Get user's transaction history
+    Get user's transaction history (newest first, keyset-paginated)
 
     Request body:
     {
         "session_token": "usr_abc123...",
         "limit": 20,
-        "offset": 0
+        "cursor": "MjAyNS0..."  // Optional: next_cursor from the previous page
     }
+
+    "offset" is deprecated: it is still accepted on its own for older clients
+    (and gets slower on deep pages), but not together with "cursor".
     """
     try:
         data = request.get_json()
         session_token = data.get('session_token')
-        limit = data.get('limit', 20)
-        offset = data.get('offset', 0)
+        page_cursor = data.get('cursor')
 
         if not session_token or session_token not in active_sessions:
             return jsonify({'error': 'Invalid session token'}), 401
@@ -1750,6 +3443,22 @@ def get_user_transactions():
         session = active_sessions[session_token]
         user_id = session['user_id']
 
+        try:
+            limit = max(1, min(int(data.get('limit', 20)), TRANSACTIONS_MAX_PAGE_SIZE))
+            offset = int(data.get('offset', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        if offset < 0:
+            return jsonify({'error': 'offset must not be negative'}), 400
+        if offset and page_cursor:
+            return jsonify({'error': 'offset is deprecated and cannot be combined with cursor'}), 400
+
+        if page_cursor:
+            try:
+                cursor_created_at, cursor_id = decode_page_cursor(page_cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
         # Connect to database
         conn = get_db_connection()
         if not conn:
@@ -1758,8 +3467,8 @@ def get_user_transactions():
         cursor = conn.cursor(dictionary=True)
 
         try:
-            # Get transactions
-            cursor.execute("""
+            # Get transactions (walks idx_user_created; fetch one extra row to detect a next page)
+            query = """
                 SELECT
                     ct.id,
                     ct.transaction_type AS type,
@@ -1772,20 +3481,40 @@ def get_user_transactions():
                 FROM credit_transactions ct
                 LEFT JOIN credit_packages cp ON ct.package_id = cp.id
                 WHERE ct.user_id = %s
-                ORDER BY ct.created_at DESC
-                LIMIT %s OFFSET %s
-            """, (user_id, limit, offset))
+            """
+            params = [user_id]
 
+            if page_cursor:
+                query += " AND (ct.created_at < %s OR (ct.created_at = %s AND ct.id < %s))"
+                params.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+            query += " ORDER BY ct.created_at DESC, ct.id DESC LIMIT %s"
+            params.append(limit + 1)
+
+            if offset:
+                query += " OFFSET %s"
+                params.append(offset)
+
+            cursor.execute(query, params)
             transactions = cursor.fetchall()
 
-            # Get total count
+            has_more = len(transactions) > limit
+            transactions = transactions[:limit]
+
+            next_cursor = None
+            if has_more:
+                last = transactions[-1]
+                next_cursor = encode_page_cursor(last['created_at'], last['id'])
+
+            # Get total count (maintained by the credit procedures)
             cursor.execute("""
-                SELECT COUNT(*) as total
-                FROM credit_transactions
-                WHERE user_id = %s
+                SELECT transaction_count AS total
+                FROM users
+                WHERE id = %s
             """, (user_id,))
 
-            total_count = cursor.fetchone()['total']
+            row = cursor.fetchone()
+            total_count = row['total'] if row else 0
 
             # Format transactions
             for txn in transactions:
@@ -1795,7 +3524,9 @@ def get_user_transactions():
 
             return jsonify({
                 'transactions': transactions,
-                'total_count': total_count
+                'total_count': total_count,
+                'next_cursor': next_cursor,
+                'has_more': has_more
             })
 
         finally:
@@ -1803,9 +3534,231 @@ def get_user_transactions():
             conn.close()
 
     except Exception as e:
-        print(f"Get transactions error: {e}")
+        log.error(f"Get transactions error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+# ==================== DATA EXPORTS ====================
+
+# Exports stream rows from an unbuffered cursor in EXPORT_FETCH_SIZE batches,
+# so memory stays flat however many rows match. Decimals are written as
+# strings to keep them exact.
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+EXPORT_NET_WRITE_TIMEOUT = int(os.getenv('EXPORT_NET_WRITE_TIMEOUT', 600))  # Seconds MySQL waits on a slow reader
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+CREDIT_TRANSACTION_EXPORT_COLUMNS = [
+    'id', 'user_id', 'transaction_type', 'amount', 'balance_after', 'package_id',
+    'usd_amount', 'payment_method', 'e9th_tx_hash', 'job_id', 'songs_downloaded',
+    'is_e9th_direct_payment', 'e9th_direct_bonus', 'created_at'
+]
+E9TH_COLLECTION_EXPORT_COLUMNS = [
+    'id', 'user_id', 'transaction_id', 'credits_used', 'e9th_tokens_collected', 'job_id',
+    'songs_downloaded', 'collection_status', 'transfer_tx_hash', 'collected_at', 'transferred_at'
+]
+
+def parse_export_range():
+    """Read ?from= and ?to= (ISO date or datetime; a date-only `to` includes that whole day)"""
+    bounds = []
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        parsed = datetime.fromisoformat(value)  # ValueError on bad input
+        if name == 'to' and len(value) == 10:
+            parsed += timedelta(days=1)
+        bounds.append(parsed)
+    return bounds
+
+def export_value(value):
+    """Make a column value JSON/CSV friendly without losing precision"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+def stream_export(query, params, columns, export_format):
+    """Run query on its own connection and yield it as NDJSON or CSV"""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT,))
+        cursor.execute(query, params)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(columns)
+
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+
+            if export_format == 'csv':
+                for row in rows:
+                    writer.writerow(['' if value is None else export_value(value) for value in row])
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, map(export_value, row)))))
+                    buffer.write('\n')
+
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        try:
+            cursor.close()
+        except Error:
+            pass  # Unread rows left behind when the client disconnects mid-export
+        conn.close()
+
+def export_user_scope():
+    """
+    Whose rows an export may include: (user_id, None), or (None, error response)
+
+    Users export their own rows with ?session_token=. An admin token without
+    a session_token exports every user (user_id None).
+    """
+    session_token = request.args.get('session_token')
+    if not session_token and admin_authorized():
+        return None, None
+
+    session = active_sessions.get(session_token) if session_token else None
+    if not session or not session.get('user_id'):
+        return None, (jsonify({'error': 'Invalid session'}), 401)
+
+    if datetime.now() > datetime.fromisoformat(session['expires_at']):
+        return None, (jsonify({'error': 'Session expired'}), 401)
+
+    return session['user_id'], None
+
+def export_response(query, params, columns, filename):
+    """Streaming Response for an export, honouring ?format=ndjson|csv"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    # Check the database before committing to a 200 streaming response
+    rows = stream_export(query, params, columns, export_format)
+    try:
+        first = next(rows)
+    except StopIteration:
+        first = ''
+
+    def generate():
+        yield first
+        yield from rows
+
+    response = Response(generate(), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/exports/credit-transactions', methods=['GET'])
+def export_credit_transactions():
+    """
+    Stream credit transactions, oldest first
+
+    Query params:
+    - format: ndjson (default) or csv
+    - from / to: ISO date or datetime range on created_at (optional)
+    - type: transaction_type filter (purchase, bonus, deduction, refund, admin_adjustment)
+    - session_token: session of the user whose transactions to export
+      (required unless the request carries the admin API token, which exports all users)
+    """
+    try:
+        user_id, error_response = export_user_scope()
+        if error_response:
+            return error_response
+
+        try:
+            date_from, date_to = parse_export_range()
+        except ValueError:
+            return jsonify({'error': 'from/to must be ISO dates'}), 400
+
+        query = f"SELECT {', '.join(CREDIT_TRANSACTION_EXPORT_COLUMNS)} FROM credit_transactions WHERE 1=1"
+        params = []
+
+        if user_id is not None:
+            query += " AND user_id = %s"
+            params.append(user_id)
+
+        transaction_type = request.args.get('type')
+        if transaction_type:
+            query += " AND transaction_type = %s"
+            params.append(transaction_type)
+
+        if date_from:
+            query += " AND created_at >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND created_at < %s"
+            params.append(date_to)
+
+        # Walks idx_created_at (or idx_user_created with a user filter) in order
+        query += " ORDER BY created_at, id"
+
+        return export_response(query, params, CREDIT_TRANSACTION_EXPORT_COLUMNS, 'credit_transactions')
+
+    except Exception as e:
+        log.error(f"Export credit transactions error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/exports/e9th-collections', methods=['GET'])
+def export_e9th_collections():
+    """
+    Stream e9th collections, oldest first
+
+    Query params:
+    - format: ndjson (default) or csv
+    - from / to: ISO date or datetime range on collected_at (optional)
+    - status: collection_status filter (pending, collected, transferred, failed)
+    - session_token: session of the user whose collections to export
+      (required unless the request carries the admin API token, which exports all users)
+    """
+    try:
+        user_id, error_response = export_user_scope()
+        if error_response:
+            return error_response
+
+        try:
+            date_from, date_to = parse_export_range()
+        except ValueError:
+            return jsonify({'error': 'from/to must be ISO dates'}), 400
+
+        query = f"SELECT {', '.join(E9TH_COLLECTION_EXPORT_COLUMNS)} FROM e9th_collections WHERE 1=1"
+        params = []
+
+        if user_id is not None:
+            query += " AND user_id = %s"
+            params.append(user_id)
+
+        status_filter = request.args.get('status')
+        if status_filter:
+            query += " AND collection_status = %s"
+            params.append(status_filter)
+
+        if date_from:
+            query += " AND collected_at >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND collected_at < %s"
+            params.append(date_to)
+
+        # Served by the (…, collected_at) composite indexes
+        query += " ORDER BY collected_at, id"
+
+        return export_response(query, params, E9TH_COLLECTION_EXPORT_COLUMNS, 'e9th_collections')
+
+    except Exception as e:
+        log.error(f"Export e9th collections error: {e}")
+        return jsonify({'error': str(e)}), 500
 
 # ==================== FREE TIER ENDPOINTS ====================
 
@@ -1813,6 +3766,7 @@ def get_user_transactions():
 ad_views = {}
 
 @app.route('/api/session/free', methods=['POST'])
+@rate_limited(('free_session_ip', RATE_LIMIT_FREE_SESSION_IP, by_ip))
 def create_free_session():
     """
     Create a free session with 3 initial credits
@@ -1864,7 +3818,7 @@ def create_free_session():
             'user_agent': user_agent
         }
 
-        print(f"Created free session: {session_token} for IP: {ip_address}")
+        log.info(f"Created free session: {session_token} for IP: {ip_address}")
 
         return jsonify({
             'session_token': session_token,
@@ -1875,11 +3829,12 @@ def create_free_session():
         })
 
     except Exception as e:
-        print(f"Error creating free session: {e}")
+        log.error(f"Error creating free session: {e}")
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/ad/start', methods=['POST'])
+@rate_limited(('ad_start_session', RATE_LIMIT_AD_START_SESSION, by_session), ('ad_start_ip', RATE_LIMIT_AD_START_IP, by_ip))
 def start_ad_view():
     """
     Start an ad view session for Google AdSense
@@ -1937,7 +3892,7 @@ def start_ad_view():
             'user_agent': request.headers.get('User-Agent', '')
         }
 
-        print(f"Started ad view: {ad_id} for session: {session_token}")
+        log.info(f"Started ad view: {ad_id} for session: {session_token}")
 
         return jsonify({
             'ad_id': ad_id,
@@ -1947,7 +3902,7 @@ def start_ad_view():
         })
 
     except Exception as e:
-        print(f"Error starting ad view: {e}")
+        log.error(f"Error starting ad view: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -2027,7 +3982,7 @@ def complete_ad_view():
 
         new_credits = session['free_credits']
 
-        print(f"Granted credit: {ad_id} -> session: {session_token} (now has {new_credits} credits)")
+        log.info(f"Granted credit: {ad_id} -> session: {session_token} (now has {new_credits} credits)")
 
         return jsonify({
             'success': True,
@@ -2038,7 +3993,7 @@ def complete_ad_view():
         })
 
     except Exception as e:
-        print(f"Error completing ad view: {e}")
+        log.error(f"Error completing ad view: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+API load test against local stand-ins
+
+Starts the fake Stripe/CDN servers and api.app (benchmarks/serve_api.py) as
+separate processes, seeds benchmark users, then drives a weighted mix of
+login, balance, packages, start-download and job-status polling from
+concurrent virtual users. Reports p50/p95/p99 latency and throughput per
+endpoint; --output saves the results (tagged with the git commit) and
+--compare prints the change against an earlier run.
+
+Database: a throwaway local MySQL or MariaDB loaded with the schema, using
+the same DB_HOST/DB_USER/DB_PASSWORD/DB_NAME/DB_PORT variables as the API:
+    mysql -u root -p hikeyz_bench < database/schema_credits.sql
+    mysql -u root -p hikeyz_bench < database/schema_e9th_collection.sql
+    (then the database/migration_*.sql files)
+    mysql -u root -p hikeyz_bench < database/stored_procedures_e9th.sql
+
+Usage:
+    DB_NAME=hikeyz_bench python3 benchmarks/api_load.py --concurrency 20 --duration 60 \\
+        --output bench-api.json [--compare bench-api-before.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import bcrypt
+import mysql.connector
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_MIX = 'login=1,balance=5,packages=3,start_download=1'
+BENCH_PIN = '1234'
+JOB_TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+def parse_mix(spec):
+    """'login=1,balance=5' -> [('login', 1.0), ('balance', 5.0)]"""
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, index))]
+
+def git_revision():
+    """Short commit hash of the tree being measured, '-dirty' if modified"""
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+# ==================== SETUP ====================
+
+def start_stand_ins(args):
+    """Start stand_ins.py in its own process; returns (process, urls)"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'stand_ins.py'),
+         '--stripe-latency', str(args.stripe_latency),
+         '--cdn-file-size', str(args.cdn_file_size),
+         '--cdn-latency', str(args.cdn_latency)],
+        stdout=subprocess.PIPE, text=True
+    )
+    urls = json.loads(process.stdout.readline())
+    return process, urls
+
+def start_api(args, urls):
+    """Start api.app via serve_api.py and wait until it answers"""
+    env = dict(os.environ,
+               BENCH_STRIPE_URL=urls['stripe_url'],
+               BENCH_CDN_URL=urls['cdn_url'],
+               BENCH_SONGS_PER_JOB=str(args.songs_per_job),
+               BENCH_PORT=str(args.port),
+               BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+               LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'))
+
+    if args.server == 'gunicorn':
+        command = ['gunicorn', 'benchmarks.serve_api:app', '--bind', f"127.0.0.1:{args.port}",
+                   '--worker-class', 'gthread', '--threads', str(args.threads), '--workers', '1']
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'benchmarks', 'serve_api.py')]
+
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("API process exited during startup")
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("API did not start within 30 seconds")
+
+def seed_users(count, bcrypt_rounds):
+    """Create (or top up) benchmark users directly in the database"""
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', ''),
+        database=os.getenv('DB_NAME', 'hikeyz_db'),
+        port=int(os.getenv('DB_PORT', 3306))
+    )
+    cursor = conn.cursor()
+    try:
+        pin_hash = bcrypt.hashpw(BENCH_PIN.encode(), bcrypt.gensalt(rounds=bcrypt_rounds)).decode()
+        emails = [f"bench-user-{i}@bench.local" for i in range(count)]
+        cursor.executemany("""
+            INSERT INTO users (email, pin_hash, credit_balance, status)
+            VALUES (%s, %s, 1000000, 'active')
+            ON DUPLICATE KEY UPDATE pin_hash = VALUES(pin_hash),
+                                    credit_balance = 1000000, status = 'active'
+        """, [(email, pin_hash) for email in emails])
+        conn.commit()
+        return emails
+    finally:
+        cursor.close()
+        conn.close()
+
+# ==================== LOAD ====================
+
+class Recorder:
+    """Per-endpoint latencies and status counts, one list per thread (merged at the end)"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.all = []
+        self.lock = threading.Lock()
+
+    def samples(self):
+        samples = getattr(self.local, 'samples', None)
+        if samples is None:
+            samples = self.local.samples = []
+            with self.lock:
+                self.all.append(samples)
+        return samples
+
+    def record(self, endpoint, seconds, status):
+        self.samples().append((endpoint, seconds, status))
+
+    def merged(self):
+        with self.lock:
+            return [sample for samples in self.all for sample in samples]
+
+def timed_request(recorder, http, endpoint, method, url, **kwargs):
+    """Issue one request, record it under endpoint, return the response (or None)"""
+    started = time.perf_counter()
+    try:
+        response = http.request(method, url, timeout=60, **kwargs)
+        status = response.status_code
+    except requests.RequestException:
+        response, status = None, 'error'
+    recorder.record(endpoint, time.perf_counter() - started, status)
+    return response
+
+def virtual_user(args, base_url, email, mix, recorder, deadline, seed):
+    """Loop over weighted operations until the deadline"""
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    session_token = None
+
+    with requests.Session() as http:
+        while time.time() < deadline:
+            operation = 'login' if session_token is None else rng.choices(names, weights)[0]
+
+            if operation == 'login':
+                response = timed_request(recorder, http, 'login', 'POST', f"{base_url}/api/users/login",
+                                         json={'email': email, 'pin': BENCH_PIN})
+                if response is not None and response.status_code == 200:
+                    session_token = response.json()['session_token']
+                elif session_token is None:
+                    time.sleep(0.5)
+
+            elif operation == 'balance':
+                timed_request(recorder, http, 'balance', 'POST', f"{base_url}/api/users/balance",
+                              json={'session_token': session_token})
+
+            elif operation == 'packages':
+                timed_request(recorder, http, 'packages', 'GET', f"{base_url}/api/credits/packages")
+
+            elif operation == 'checkout':
+                timed_request(recorder, http, 'checkout', 'POST', f"{base_url}/api/create-checkout-session",
+                              json={'session_token': session_token, 'package_id': 1})
+
+            elif operation == 'start_download':
+                response = timed_request(recorder, http, 'start_download', 'POST', f"{base_url}/api/start-download",
+                                         json={'session_token': session_token,
+                                               'requested_songs': args.songs_per_job})
+                if response is None or response.status_code != 200:
+                    continue
+
+                job_id = response.json()['job_id']
+                while time.time() < deadline:
+                    time.sleep(args.poll_interval)
+                    status = timed_request(recorder, http, 'job_status', 'GET', f"{base_url}/api/job-status/{job_id}")
+                    if status is None or status.status_code != 200:
+                        break
+                    if status.json().get('status') in JOB_TERMINAL_STATUSES:
+                        break
+
+def run_load(args, base_url, emails):
+    """Run the virtual users and return (samples, elapsed seconds)"""
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    deadline = time.time() + args.duration
+    started = time.perf_counter()
+
+    threads = [
+        threading.Thread(target=virtual_user,
+                         args=(args, base_url, emails[i % len(emails)], mix, recorder, deadline, args.seed + i),
+                         daemon=True)
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return recorder.merged(), time.perf_counter() - started
+
+# ==================== REPORT ====================
+
+def summarize(samples, elapsed):
+    """Per-endpoint count, errors, throughput and latency percentiles (ms)"""
+    by_endpoint = {}
+    for endpoint, seconds, status in samples:
+        by_endpoint.setdefault(endpoint, []).append((seconds, status))
+
+    results = {}
+    for endpoint, entries in sorted(by_endpoint.items()):
+        latencies = sorted(seconds for seconds, _ in entries)
+        statuses = {}
+        for _, status in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        results[endpoint] = {
+            'requests': len(entries),
+            'errors': sum(1 for _, status in entries if status == 'error' or status >= 400),
+            'throughput_rps': len(entries) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'statuses': statuses,
+        }
+    return results
+
+def print_report(results, baseline=None):
+    """Print the results table, with % change against baseline if given"""
+    def change(endpoint, key, value):
+        if not baseline or endpoint not in baseline or not baseline[endpoint][key]:
+            return ''
+        return f" ({(value / baseline[endpoint][key] - 1) * 100:+.0f}%)"
+
+    print(f"{'endpoint':<16}{'reqs':>8}{'errors':>8}{'req/s':>16}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}")
+    print("-" * 102)
+    for endpoint, r in results.items():
+        print(f"{endpoint:<16}{r['requests']:>8}{r['errors']:>8}"
+              f"{r['throughput_rps']:>9.1f}{change(endpoint, 'throughput_rps', r['throughput_rps']):>7}"
+              f"{r['p50_ms']:>11.1f}{change(endpoint, 'p50_ms', r['p50_ms']):>7}"
+              f"{r['p95_ms']:>11.1f}{change(endpoint, 'p95_ms', r['p95_ms']):>7}"
+              f"{r['p99_ms']:>11.1f}{change(endpoint, 'p99_ms', r['p99_ms']):>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="API load test against local stand-ins")
+    parser.add_argument('--concurrency', type=int, default=10, help="virtual users")
+    parser.add_argument('--users', type=int, default=50, help="distinct accounts to seed")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help="weights for login, balance, packages, checkout, start_download")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="job-status poll interval")
+    parser.add_argument('--songs-per-job', type=int, default=5)
+    parser.add_argument('--cdn-file-size', type=int, default=256 * 1024)
+    parser.add_argument('--cdn-latency', type=float, default=0.02)
+    parser.add_argument('--stripe-latency', type=float, default=0.05)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    parser.add_argument('--threads', type=int, default=16, help="gunicorn gthread threads")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=1, help="random seed for the operation mix")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--compare', help="results JSON from an earlier run")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("API LOAD TEST")
+    print("="*60)
+
+    emails = seed_users(args.users, args.bcrypt_rounds)
+    stand_ins, urls = start_stand_ins(args)
+    api = None
+    try:
+        api, base_url = start_api(args, urls)
+        print(f"API: {base_url} ({args.server}), {args.concurrency} virtual users for {args.duration:.0f}s")
+        print(f"Mix: {args.mix}\n")
+
+        samples, elapsed = run_load(args, base_url, emails)
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait()
+        stand_ins.terminate()
+        stand_ins.wait()
+
+    results = summarize(samples, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        baseline = previous['results']
+        print(f"Compared with {previous.get('revision', '?')} (% change in parentheses)\n")
+
+    print_report(results, baseline)
+    print(f"\nTotal: {len(samples)} requests in {elapsed:.1f}s ({len(samples) / elapsed:.1f} req/s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'config': vars(args),
+                'elapsed_seconds': elapsed,
+                'results': results
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
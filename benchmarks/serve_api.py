@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Run api.app wired to the benchmark stand-ins
+
+Environment:
+    BENCH_STRIPE_URL     fake Stripe base URL (stand_ins.py)
+    BENCH_CDN_URL        fake CDN base URL (stand_ins.py)
+    BENCH_SONGS_PER_JOB  songs each stand-in download job fetches
+    BENCH_PORT           port for the built-in server (default 5055)
+
+Rate limiting is off unless RATE_LIMIT_ENABLED is set: every load-test
+client shares 127.0.0.1, so the login limits would turn the mix into 429s.
+
+Under gunicorn: gunicorn benchmarks.serve_api:app --worker-class gthread --threads 16
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+import stripe
+import api.app as api_app
+from benchmarks.stand_ins import StandInDownloader
+
+stripe.api_base = os.environ['BENCH_STRIPE_URL']
+StandInDownloader.cdn_base = os.environ['BENCH_CDN_URL']
+StandInDownloader.songs_per_job = int(os.getenv('BENCH_SONGS_PER_JOB', 10))
+api_app.load_downloader_class = lambda: StandInDownloader
+
+app = api_app.app
+
+if __name__ == "__main__":
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No access log line per request
+
+    server = make_server('127.0.0.1', int(os.getenv('BENCH_PORT', 5055)), app, threaded=True)
+    server.serve_forever()
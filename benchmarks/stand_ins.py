@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for external services used by the benchmarks
+(fake Stripe API, fake SUNO CDN, fake WebDriver, and a downloader that
+talks to the fake CDN)
+"""
+
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """Request handler that does not log every request to stderr"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_server(handler_class, host='127.0.0.1', port=0):
+    """Serve handler_class on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+# ==================== FAKE STRIPE ====================
+
+class FakeStripeHandler(QuietHandler):
+    """Answers the Stripe calls the API makes (prices, checkout sessions)"""
+
+    latency = 0.05
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        time.sleep(self.latency)
+
+        object_id = secrets.token_hex(12)
+        if self.path.startswith('/v1/prices'):
+            self.send_json(200, {'id': f"price_{object_id}", 'object': 'price'})
+        elif self.path.startswith('/v1/checkout/sessions'):
+            self.send_json(200, {
+                'id': f"cs_test_{object_id}",
+                'object': 'checkout.session',
+                'url': f"https://checkout.stripe.test/c/{object_id}"
+            })
+        else:
+            self.send_json(404, {'error': {'message': f"No fake for {self.path}"}})
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_json(404, {'error': {'message': f"No fake for {self.path}"}})
+
+def start_fake_stripe(latency=0.05):
+    """Start the fake Stripe API; point stripe.api_base at the returned URL"""
+    handler = type('ConfiguredFakeStripeHandler', (FakeStripeHandler,), {'latency': latency})
+    return start_server(handler)
+
+# ==================== FAKE CDN ====================
+
+class FakeCDNHandler(QuietHandler):
+    """Mimics cdn1.suno.ai: GET /<song_id>.mp3 returns file_size bytes"""
+
+    file_size = 3 * 1024 * 1024
+    latency = 0.0        # Seconds before the first byte
+    error_rate = 0.0     # Fraction of requests answered with 500
+    throttle_rate = 0.0  # Fraction of requests answered with 429
+    chunk = b'\0' * 65536
+
+    def do_GET(self):
+        if not self.path.endswith('.mp3'):
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        time.sleep(self.latency)
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if roll < self.throttle_rate + self.error_rate:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(self.file_size))
+        self.end_headers()
+
+        remaining = self.file_size
+        try:
+            while remaining > 0:
+                piece = self.chunk[:min(len(self.chunk), remaining)]
+                self.wfile.write(piece)
+                remaining -= len(piece)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def start_fake_cdn(file_size=3 * 1024 * 1024, latency=0.0, error_rate=0.0, throttle_rate=0.0):
+    """Start the fake CDN; returns (server, base_url)"""
+    handler = type('ConfiguredFakeCDNHandler', (FakeCDNHandler,), {
+        'file_size': file_size,
+        'latency': latency,
+        'error_rate': error_rate,
+        'throttle_rate': throttle_rate,
+    })
+    return start_server(handler)
+
+# ==================== STAND-IN DOWNLOADER ====================
+
+class StandInDownloader:
+    """
+    Drop-in for SUNODownloader in API benchmarks: no browser, songs come
+    from the fake CDN, progress goes through the same callback
+    """
+
+    cdn_base = None
+    songs_per_job = 10
+
+    def __init__(self, job_id, session_token, credentials, max_songs=20, progress_callback=None,
+                 song_metrics_callback=None, profile_dir=None):
+        self.job_id = job_id
+        self.max_songs = max_songs
+        self.progress_callback = progress_callback
+        self.song_metrics_callback = song_metrics_callback
+        self.progress = {'status': 'pending', 'total_songs': 0, 'downloaded': 0, 'failed': 0,
+                         'current_song': None, 'error_message': None}
+        self.heartbeat = {'at': time.monotonic(), 'bytes': 0}
+        self.abort_reason = None
+
+    def abort(self, reason):
+        self.abort_reason = reason
+
+    def update_progress(self, **kwargs):
+        self.progress.update(kwargs)
+        self.heartbeat['at'] = time.monotonic()
+        if self.progress_callback and not self.abort_reason:
+            self.progress_callback(dict(self.progress))
+
+    def run(self):
+        total = min(self.max_songs, self.songs_per_job)
+        self.update_progress(status='processing', total_songs=total, current_song='Starting downloads')
+
+        downloaded = failed = 0
+        with requests.Session() as http:
+            for i in range(1, total + 1):
+                song_id = f"{self.job_id}-{i}"
+                self.update_progress(current_song=f"Song {i}")
+                started = time.perf_counter()
+                size = 0
+                try:
+                    response = http.get(f"{self.cdn_base}/{song_id}.mp3", stream=True, timeout=30)
+                    ok = response.status_code == 200
+                    if ok:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            size += len(chunk)
+                except requests.RequestException:
+                    ok = False
+
+                if ok:
+                    downloaded += 1
+                else:
+                    failed += 1
+                if self.song_metrics_callback:
+                    self.song_metrics_callback(time.perf_counter() - started, size, ok)
+                self.update_progress(downloaded=downloaded, failed=failed)
+
+        self.update_progress(status='completed', current_song=None)
+        return {'success': True, 'total_songs': total, 'downloaded': downloaded,
+                'songs_downloaded': downloaded, 'failed': failed, 'zip_path': None}
+
+# ==================== FAKE WEBDRIVER ====================
+
+class FakeElement:
+    """Song anchor (or its parent) as load_songs sees it"""
+
+    def __init__(self, href=None, text=''):
+        self.href = href
+        self.text = text
+
+    def get_attribute(self, name):
+        return self.href if name == 'href' else None
+
+    def find_element(self, by, value):
+        # load_songs only asks for the parent ('..') to read the title
+        return FakeElement(text=self.text)
+
+class FakeDriver:
+    """
+    WebDriver stand-in for a SUNO profile with song_count songs; each scroll
+    reveals another batch of anchors, like the real infinite scroll
+    """
+
+    def __init__(self, song_count, batch_size=20):
+        self.current_url = 'https://suno.com/me'
+        self.batch_size = batch_size
+        self.visible = min(batch_size, song_count)
+        self.anchors = [
+            FakeElement(
+                href=f"https://suno.com/song/{i:08d}-bench-{secrets.token_hex(8)}?sh=bench",
+                text=f"Bench Song {i}\n3:{i % 60:02d}"
+            )
+            for i in range(song_count)
+        ]
+
+    def get(self, url):
+        self.current_url = url
+
+    def find_elements(self, by, value):
+        return self.anchors[:self.visible]
+
+    def execute_script(self, script, *args):
+        self.visible = min(len(self.anchors), self.visible + self.batch_size)
+
+    def execute_cdp_cmd(self, cmd, args):
+        # No SUNO session cookie: the song list cache is bypassed
+        return {'cookies': []}
+
+    def quit(self):
+        pass
+
+# ==================== STANDALONE ====================
+
+def main():
+    """Run the fake Stripe and CDN servers in their own process and print their URLs as JSON"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--stripe-latency', type=float, default=0.05)
+    parser.add_argument('--cdn-file-size', type=int, default=3 * 1024 * 1024)
+    parser.add_argument('--cdn-latency', type=float, default=0.0)
+    parser.add_argument('--cdn-error-rate', type=float, default=0.0)
+    parser.add_argument('--cdn-throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    _, stripe_url = start_fake_stripe(args.stripe_latency)
+    _, cdn_url = start_fake_cdn(args.cdn_file_size, args.cdn_latency, args.cdn_error_rate, args.cdn_throttle_rate)
+    print(json.dumps({'stripe_url': stripe_url, 'cdn_url': cdn_url}), flush=True)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
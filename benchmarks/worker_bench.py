@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+SUNODownloader throughput benchmark
+
+Runs the real SUNODownloader.run against a fake WebDriver that serves N
+synthetic song anchors and a local server standing in for cdn1.suno.ai
+(configurable file size, latency, error rate and 429s). No Chrome and no
+SUNO account needed. Reports discovery time, songs/sec, MB/s, ZIP time and
+peak RSS; --output saves the results tagged with the git commit and
+--compare prints the change against an earlier run.
+
+Usage:
+    python3 benchmarks/worker_bench.py --songs 200 --file-size 3145728 \\
+        --cdn-latency 0.05 --error-rate 0.02 --throttle-rate 0.01 --output bench-worker.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def main():
+    parser = argparse.ArgumentParser(description="SUNODownloader throughput benchmark")
+    parser.add_argument('--songs', type=int, default=100, help="songs on the fake profile")
+    parser.add_argument('--batch-size', type=int, default=20, help="anchors revealed per scroll")
+    parser.add_argument('--file-size', type=int, default=3 * 1024 * 1024, help="bytes per song")
+    parser.add_argument('--cdn-latency', type=float, default=0.0, help="seconds before first byte")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of 500s")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of 429s")
+    parser.add_argument('--song-delay', type=float, default=0.0,
+                        help="SONG_DELAY_SECONDS between songs (production: 1.5)")
+    parser.add_argument('--scroll-wait', type=float, default=0.0,
+                        help="SCROLL_WAIT_SECONDS per scroll (production: 2)")
+    parser.add_argument('--keep-files', action='store_true', help="keep the download directory")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--compare', help="results JSON from an earlier run")
+    args = parser.parse_args()
+
+    download_dir = tempfile.mkdtemp(prefix='hikeyz-bench-')
+
+    # The worker reads these at import time
+    os.environ.update({
+        'DOWNLOAD_DIR': download_dir,
+        'SONG_LIST_CACHE_DIR': os.path.join(download_dir, '.song-lists'),  # Cold discovery every run
+        'PAGE_LOAD_WAIT_SECONDS': '0',
+        'SCROLL_WAIT_SECONDS': str(args.scroll_wait),
+        'SONG_DELAY_SECONDS': str(args.song_delay),
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    })
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, 'workers'))
+    from suno_downloader import SUNODownloader
+    from benchmarks.stand_ins import FakeDriver
+    from benchmarks.api_load import git_revision
+
+    # CDN runs in its own process so it does not share this process's CPU or RSS
+    cdn = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'stand_ins.py'),
+         '--cdn-file-size', str(args.file_size),
+         '--cdn-latency', str(args.cdn_latency),
+         '--cdn-error-rate', str(args.error_rate),
+         '--cdn-throttle-rate', str(args.throttle_rate)],
+        stdout=subprocess.PIPE, text=True
+    )
+    cdn_url = json.loads(cdn.stdout.readline())['cdn_url']
+
+    phases = {}
+    transferred = {'bytes': 0}
+
+    class BenchDownloader(SUNODownloader):
+        """SUNODownloader wired to the fake driver and CDN, with phase timers"""
+
+        def connect_to_chrome(self):
+            return FakeDriver(args.songs, args.batch_size)
+
+        def get_cdn_url(self, song_id):
+            return f"{cdn_url}/{song_id}.mp3"
+
+        def load_songs(self, driver):
+            started = time.perf_counter()
+            songs = super().load_songs(driver)
+            phases['discovery_seconds'] = time.perf_counter() - started
+            phases['download_started'] = time.perf_counter()
+            return songs
+
+        def create_zip(self):
+            phases['download_seconds'] = time.perf_counter() - phases['download_started']
+            started = time.perf_counter()
+            zip_path = super().create_zip()
+            phases['zip_seconds'] = time.perf_counter() - started
+            return zip_path
+
+    def count_bytes(seconds, size, success):
+        transferred['bytes'] += size
+
+    print("="*60)
+    print("WORKER BENCHMARK")
+    print("="*60)
+    print(f"{args.songs} songs x {args.file_size / 1024 / 1024:.2f} MB, CDN latency {args.cdn_latency}s, "
+          f"errors {args.error_rate:.0%}, 429s {args.throttle_rate:.0%}\n")
+
+    try:
+        downloader = BenchDownloader('bench', 'bench_session', {}, max_songs=args.songs,
+                                     song_metrics_callback=count_bytes)
+        started = time.perf_counter()
+        result = downloader.run()
+        total_seconds = time.perf_counter() - started
+    finally:
+        cdn.terminate()
+        cdn.wait()
+        if not args.keep_files:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+    if not result.get('success'):
+        print(f"✗ Run failed: {result.get('error')}")
+        sys.exit(1)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss_kb //= 1024
+
+    download_seconds = phases.get('download_seconds', 0.0)
+    results = {
+        'songs_found': result['total_songs'],
+        'songs_downloaded': result['downloaded'],
+        'songs_failed': result['failed'],
+        'discovery_seconds': phases.get('discovery_seconds', 0.0),
+        'download_seconds': download_seconds,
+        'songs_per_second': result['downloaded'] / download_seconds if download_seconds else 0.0,
+        'mb_per_second': transferred['bytes'] / 1024 / 1024 / download_seconds if download_seconds else 0.0,
+        'zip_seconds': phases.get('zip_seconds', 0.0),
+        'total_seconds': total_seconds,
+        'peak_rss_mb': peak_rss_kb / 1024,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        baseline = previous['results']
+        print(f"Compared with {previous.get('revision', '?')}\n")
+
+    for key, value in results.items():
+        line = f"  {key:<20}{value:>12.3f}" if isinstance(value, float) else f"  {key:<20}{value:>12}"
+        if baseline and baseline.get(key):
+            line += f"  ({(value / baseline[key] - 1) * 100:+.0f}%)"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'config': vars(args),
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+-- ========================================
+-- ANALYTICS ROLLUP TABLES
+-- Incrementally maintained summaries behind the reporting views, so a
+-- report costs the same regardless of how many transactions exist
+-- ========================================
+--
+-- Rollup rows are split into 16 slots by user_id % 16 (like
+-- e9th_pending_totals) so concurrent writes from different users rarely
+-- contend on one row; the views sum the slots.
+--
+-- Maintained by:
+--   e9th_collection_daily       refresh_e9th_collection_daily (scheduled event below)
+--   e9th_direct_payment_totals  add_credits
+--   revenue_daily               refresh_revenue_daily (scheduled event below)
+--
+-- The daily collection rollup is recomputed rather than written inside
+-- deduct_credits, which holds the user row FOR UPDATE for its whole
+-- transaction; today's figures lag by up to the event interval.
+
+-- Daily e9th collection totals
+CREATE TABLE IF NOT EXISTS e9th_collection_daily (
+    collection_date DATE NOT NULL,
+    slot TINYINT UNSIGNED NOT NULL,
+    total_collections INT NOT NULL DEFAULT 0,
+    total_tokens_collected DECIMAL(18, 8) NOT NULL DEFAULT 0,
+    total_songs INT NOT NULL DEFAULT 0,
+    unique_users INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (collection_date, slot)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- E9th direct payment totals
+CREATE TABLE IF NOT EXISTS e9th_direct_payment_totals (
+    slot TINYINT UNSIGNED PRIMARY KEY,
+    total_payments INT NOT NULL DEFAULT 0,
+    total_amount DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    total_bonuses DECIMAL(18, 2) NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Daily revenue (legacy Stripe payments)
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    date DATE PRIMARY KEY,
+    total_payments INT NOT NULL DEFAULT 0,
+    total_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    quick_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    pro_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    active_sessions INT NOT NULL DEFAULT 0,
+    total_songs_downloaded INT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Lets the revenue refresh read only recent payments
+ALTER TABLE payments
+ADD INDEX idx_status_created (status, created_at);
+
+-- ========================================
+-- REVENUE REFRESH
+-- ========================================
+
+-- Payments can change status after the fact (refunds), so recent days are
+-- recomputed rather than incremented. p_days = NULL rebuilds everything.
+DROP PROCEDURE IF EXISTS refresh_revenue_daily;
+
+DELIMITER //
+
+CREATE PROCEDURE refresh_revenue_daily(IN p_days INT)
+BEGIN
+    DECLARE v_from DATE;
+
+    SET v_from = IF(p_days IS NULL, '1970-01-01', CURRENT_DATE() - INTERVAL p_days DAY);
+
+    START TRANSACTION;
+
+    DELETE FROM revenue_daily WHERE date >= v_from;
+
+    INSERT INTO revenue_daily (
+        date, total_payments, total_revenue, quick_revenue, pro_revenue,
+        active_sessions, total_songs_downloaded
+    )
+    SELECT
+        DATE(p.created_at),
+        COUNT(DISTINCT p.id),
+        SUM(p.amount),
+        SUM(CASE WHEN s.plan_type = 'quick' THEN p.amount ELSE 0 END),
+        SUM(CASE WHEN s.plan_type = 'pro' THEN p.amount ELSE 0 END),
+        COUNT(DISTINCT s.session_token),
+        COALESCE(SUM(s.songs_downloaded), 0)
+    FROM payments p
+    LEFT JOIN sessions s ON p.session_id = s.id
+    WHERE p.status = 'succeeded'
+    AND p.created_at >= v_from
+    GROUP BY DATE(p.created_at);
+
+    COMMIT;
+END //
+
+DELIMITER ;
+
+-- Refresh the last two days every 15 minutes (requires event_scheduler=ON;
+-- otherwise run "CALL refresh_revenue_daily(2);" from cron)
+DROP EVENT IF EXISTS refresh_revenue_daily_event;
+CREATE EVENT refresh_revenue_daily_event
+ON SCHEDULE EVERY 15 MINUTE
+DO CALL refresh_revenue_daily(2);
+
+-- ========================================
+-- COLLECTION REFRESH
+-- ========================================
+
+DROP PROCEDURE IF EXISTS refresh_e9th_collection_daily;
+
+DELIMITER //
+
+-- p_days = NULL rebuilds everything. Slots are user_id % 16, so per-slot
+-- distinct user counts still add up to the day's unique users.
+CREATE PROCEDURE refresh_e9th_collection_daily(IN p_days INT)
+BEGIN
+    DECLARE v_from DATE;
+
+    SET v_from = IF(p_days IS NULL, '1970-01-01', CURRENT_DATE() - INTERVAL p_days DAY);
+
+    START TRANSACTION;
+
+    DELETE FROM e9th_collection_daily WHERE collection_date >= v_from;
+
+    -- Reads idx_collected_at for the recent range only
+    INSERT INTO e9th_collection_daily (
+        collection_date, slot, total_collections,
+        total_tokens_collected, total_songs, unique_users
+    )
+    SELECT
+        DATE(collected_at),
+        user_id % 16,
+        COUNT(*),
+        SUM(e9th_tokens_collected),
+        COALESCE(SUM(songs_downloaded), 0),
+        COUNT(DISTINCT user_id)
+    FROM e9th_collections
+    WHERE collected_at >= v_from
+    AND collection_status IN ('collected', 'transferred')
+    GROUP BY DATE(collected_at), user_id % 16;
+
+    COMMIT;
+END //
+
+DELIMITER ;
+
+-- Refresh the last two days every 15 minutes (requires event_scheduler=ON;
+-- otherwise run "CALL refresh_e9th_collection_daily(2);" from cron)
+DROP EVENT IF EXISTS refresh_e9th_collection_daily_event;
+CREATE EVENT refresh_e9th_collection_daily_event
+ON SCHEDULE EVERY 15 MINUTE
+DO CALL refresh_e9th_collection_daily(2);
+
+-- ========================================
+-- BACKFILL
+-- ========================================
+
+CALL refresh_e9th_collection_daily(NULL);
+
+INSERT INTO e9th_direct_payment_totals (slot, total_payments, total_amount, total_bonuses)
+SELECT user_id % 16, COUNT(*), SUM(amount), SUM(e9th_direct_bonus)
+FROM credit_transactions
+WHERE is_e9th_direct_payment = TRUE
+AND transaction_type = 'purchase'
+GROUP BY user_id % 16;
+
+CALL refresh_revenue_daily(NULL);
+
+-- ========================================
+-- VIEWS (rebased on the rollups)
+-- ========================================
+
+CREATE OR REPLACE VIEW e9th_collection_summary AS
+SELECT
+    collection_date,
+    SUM(total_collections) AS total_collections,
+    SUM(total_tokens_collected) AS total_tokens_collected,
+    SUM(total_songs) AS total_songs,
+    SUM(unique_users) AS unique_users
+FROM e9th_collection_daily
+GROUP BY collection_date
+ORDER BY collection_date DESC;
+
+CREATE OR REPLACE VIEW e9th_direct_payment_stats AS
+SELECT
+    COALESCE(SUM(total_payments), 0) AS total_e9th_direct_payments,
+    SUM(total_amount) AS total_e9th_direct_amount,
+    SUM(total_bonuses) AS total_e9th_bonuses_issued,
+    SUM(total_bonuses) / NULLIF(SUM(total_payments), 0) AS avg_e9th_bonus_per_payment
+FROM e9th_direct_payment_totals;
+
+CREATE OR REPLACE VIEW revenue_analytics AS
+SELECT
+    date,
+    total_payments,
+    total_revenue,
+    quick_revenue,
+    pro_revenue,
+    active_sessions,
+    total_songs_downloaded
+FROM revenue_daily;
+
+-- user_balances is a per-user projection of the users row (no aggregate);
+-- it now reads the per-song price from pricing_config instead of 0.35
+CREATE OR REPLACE VIEW user_balances AS
+SELECT
+    u.id,
+    u.email,
+    u.credit_balance,
+    u.total_credits_purchased,
+    u.total_credits_spent,
+    u.total_songs_downloaded,
+    ROUND(u.credit_balance / COALESCE(
+        (SELECT config_value FROM pricing_config WHERE config_key = 'credits_per_song'),
+        0.35
+    ), 0) AS songs_available,
+    u.last_login_at,
+    u.created_at
+FROM users u
+WHERE u.status = 'active';
+
+-- After running this migration, reload the procedures:
+-- mysql -u root -p hikeyz_db < database/stored_procedures_e9th.sql
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Collection rollup vs. source for the last week (should match)
+SELECT d.collection_date, d.total_collections, s.total_collections AS source_collections
+FROM (
+    SELECT collection_date, SUM(total_collections) AS total_collections
+    FROM e9th_collection_daily
+    WHERE collection_date >= CURRENT_DATE() - INTERVAL 7 DAY
+    GROUP BY collection_date
+) d
+LEFT JOIN (
+    SELECT DATE(collected_at) AS collection_date, COUNT(*) AS total_collections
+    FROM e9th_collections
+    WHERE collected_at >= CURRENT_DATE() - INTERVAL 7 DAY
+    AND collection_status IN ('collected', 'transferred')
+    GROUP BY DATE(collected_at)
+) s ON s.collection_date = d.collection_date
+ORDER BY d.collection_date DESC;
@@ -0,0 +1,40 @@
+-- ========================================
+-- E9TH COLLECTIONS LISTING INDEXES
+-- Composite indexes for /api/e9th/collections keyset pagination
+-- ========================================
+
+-- The listing filters on user_id and/or collection_status and sorts by
+-- (collected_at DESC, id DESC). Each index below matches one filter
+-- combination so MySQL reads rows already in order and stops after LIMIT,
+-- instead of filesorting every matching row.
+
+-- No filter (admin overview)
+ALTER TABLE e9th_collections
+ADD INDEX idx_collected_at (collected_at, id);
+
+-- Status filter (admin: collected / transferred / failed queues)
+ALTER TABLE e9th_collections
+ADD INDEX idx_status_collected (collection_status, collected_at, id);
+
+-- User filter, with or without status
+ALTER TABLE e9th_collections
+ADD INDEX idx_user_collected (user_id, collected_at, id),
+ADD INDEX idx_user_status_collected (user_id, collection_status, collected_at, id);
+
+-- The single-column indexes are now left prefixes of the composite ones
+-- (the user_id foreign key is served by idx_user_collected)
+ALTER TABLE e9th_collections
+DROP INDEX idx_collection_status,
+DROP INDEX idx_user_id;
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Should show key = idx_status_collected and no "Using filesort"
+EXPLAIN
+SELECT ec.id
+FROM e9th_collections ec
+WHERE ec.collection_status = 'collected'
+ORDER BY ec.collected_at DESC, ec.id DESC
+LIMIT 101;
@@ -0,0 +1,36 @@
+-- ========================================
+-- E9TH FUNDING FLAG MIGRATION
+-- Lets deduct_credits decide on e9th token collection from the locked
+-- users row instead of a COUNT(*) over e9th_deposits
+-- ========================================
+
+-- TRUE once the user has a confirmed e9th deposit that issued credits
+-- (set by process_e9th_deposit)
+ALTER TABLE users
+ADD COLUMN has_e9th_funding BOOLEAN NOT NULL DEFAULT FALSE AFTER e9th_wallet_address;
+
+-- Backfill from existing deposits
+-- (re-run after manually changing e9th_deposits.status, e.g. refunds)
+UPDATE users u
+SET u.has_e9th_funding = EXISTS (
+    SELECT 1
+    FROM e9th_deposits d
+    WHERE d.user_id = u.id
+    AND d.status = 'confirmed'
+    AND d.utility_tokens_issued > 0
+);
+
+-- After running this migration, reload the procedures:
+-- mysql -u root -p hikeyz_db < database/stored_procedures_e9th.sql
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Users whose flag disagrees with their deposits (should be empty)
+SELECT u.id, u.has_e9th_funding
+FROM users u
+WHERE u.has_e9th_funding <> EXISTS (
+    SELECT 1 FROM e9th_deposits d
+    WHERE d.user_id = u.id AND d.status = 'confirmed' AND d.utility_tokens_issued > 0
+);
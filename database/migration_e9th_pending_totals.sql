@@ -0,0 +1,39 @@
+-- ========================================
+-- E9TH PENDING TOTALS & CHUNKED TRANSFERS
+-- Running aggregate of 'collected' tokens plus an id-ordered index so
+-- transfer_collected_e9th_chunk can claim bounded chunks
+-- ========================================
+
+-- Pending (collected, not yet transferred) tokens, sharded into 16 slots
+-- by user_id % 16 so deductions from different users update different rows.
+-- Maintained by deduct_credits (insert) and transfer_collected_e9th_chunk (transfer).
+CREATE TABLE IF NOT EXISTS e9th_pending_totals (
+    slot TINYINT UNSIGNED PRIMARY KEY,
+    pending_tokens DECIMAL(18, 8) NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Backfill from current collections
+REPLACE INTO e9th_pending_totals (slot, pending_tokens, pending_count)
+SELECT user_id % 16, SUM(e9th_tokens_collected), COUNT(*)
+FROM e9th_collections
+WHERE collection_status = 'collected'
+GROUP BY user_id % 16;
+
+-- Chunk claims walk 'collected' rows in id order
+ALTER TABLE e9th_collections
+ADD INDEX idx_status_id (collection_status, id);
+
+-- After running this migration, reload the procedures:
+-- mysql -u root -p hikeyz_db < database/stored_procedures_e9th.sql
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Running total vs. real total (should match)
+SELECT
+    (SELECT COALESCE(SUM(pending_tokens), 0) FROM e9th_pending_totals) AS running_total,
+    (SELECT COALESCE(SUM(e9th_tokens_collected), 0) FROM e9th_collections
+     WHERE collection_status = 'collected') AS actual_total;
@@ -0,0 +1,26 @@
+-- ========================================
+-- IDEMPOTENCY KEYS
+-- Stored responses for /api/credits/purchase and /api/e9th/deposit retries
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,  -- Client-supplied Idempotency-Key header
+    endpoint VARCHAR(50) NOT NULL,
+    request_fingerprint CHAR(64) NOT NULL,  -- SHA-256 of endpoint + request body
+    response_status SMALLINT NULL,  -- NULL while the first request is in progress
+    response_body MEDIUMTEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+
+    PRIMARY KEY (user_id, idempotency_key),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ========================================
+-- MAINTENANCE
+-- ========================================
+
+-- Purge expired keys (run daily, e.g. from cron)
+-- DELETE FROM idempotency_keys WHERE expires_at < NOW() LIMIT 10000;
@@ -0,0 +1,36 @@
+-- ========================================
+-- STRIPE WEBHOOK INBOX
+-- Webhook events are stored here and processed asynchronously
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS stripe_webhook_events (
+    event_id VARCHAR(255) PRIMARY KEY,  -- Stripe event id (evt_...), dedupes redeliveries
+    event_type VARCHAR(100) NOT NULL,
+    payload LONGTEXT NOT NULL,  -- Verified raw event JSON
+    status ENUM('pending', 'processing', 'processed', 'failed') DEFAULT 'pending',
+    attempts INT DEFAULT 0,
+    last_error TEXT NULL,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP NULL,  -- When a consumer took the event
+    processed_at TIMESTAMP NULL,
+
+    INDEX idx_status_received (status, received_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Lets add_credits detect payments that were already credited
+-- (payment intent id is stored in e9th_tx_hash by add_credits)
+ALTER TABLE credit_transactions
+ADD INDEX idx_e9th_tx_hash (e9th_tx_hash);
+
+-- After running this migration, reload the procedures (add_credits skips
+-- a tx hash that already has a purchase row, under the user row lock):
+-- mysql -u root -p hikeyz_db < database/stored_procedures_e9th.sql
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Backlog and failures
+SELECT status, COUNT(*) AS events, MIN(received_at) AS oldest
+FROM stripe_webhook_events
+GROUP BY status;
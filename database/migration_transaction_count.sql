@@ -0,0 +1,35 @@
+-- ========================================
+-- PER-USER TRANSACTION COUNT MIGRATION
+-- Replaces COUNT(*) over credit_transactions in /api/users/transactions
+-- ========================================
+
+-- Running count of credit_transactions rows per user
+-- (maintained by add_credits, deduct_credits and process_e9th_deposit)
+ALTER TABLE users
+ADD COLUMN transaction_count INT NOT NULL DEFAULT 0 AFTER total_songs_downloaded;
+
+-- Backfill from existing history
+UPDATE users u
+SET u.transaction_count = (
+    SELECT COUNT(*)
+    FROM credit_transactions ct
+    WHERE ct.user_id = u.id
+);
+
+-- Keyset pagination on (created_at, id) uses the existing
+-- idx_user_created (user_id, created_at) index; InnoDB appends the
+-- primary key to secondary indexes, so no new index is needed.
+
+-- After running this migration, reload the procedures:
+-- mysql -u root -p hikeyz_db < database/stored_procedures_e9th.sql
+
+-- ========================================
+-- VERIFICATION QUERIES
+-- ========================================
+
+-- Users whose running count has drifted from the real count (should be empty)
+SELECT u.id, u.transaction_count, COUNT(ct.id) AS actual_count
+FROM users u
+LEFT JOIN credit_transactions ct ON ct.user_id = u.id
+GROUP BY u.id, u.transaction_count
+HAVING u.transaction_count <> COUNT(ct.id);
@@ -1,6 +1,10 @@
 -- ========================================
 -- UPDATED STORED PROCEDURES FOR E9TH TOKEN COLLECTION
 -- ========================================
+--
+-- Every procedure ends by SELECTing a status row (success, error_message,
+-- new balance / amounts) so the API gets its result in the same round trip
+-- as the CALL. The OUT parameters are kept for other callers.
 
 DELIMITER //
 
@@ -27,6 +31,7 @@ BEGIN
         ROLLBACK;
         SET p_success = FALSE;
         SET p_error_message = 'Database error occurred';
+        SELECT p_success AS success, p_error_message AS error_message, NULL AS new_balance;
     END;
 
     START TRANSACTION;
@@ -39,8 +44,9 @@ BEGIN
     -- Calculate total cost
     SET v_total_cost = v_credits_per_song * p_songs_count;
 
-    -- Get current balance with lock
-    SELECT credit_balance INTO v_current_balance
+    -- Get current balance and e9th funding flag with lock
+    SELECT credit_balance, has_e9th_funding
+    INTO v_current_balance, v_user_paid_with_e9th
     FROM users
     WHERE id = p_user_id
     FOR UPDATE;
@@ -57,7 +63,8 @@ BEGIN
         UPDATE users
         SET credit_balance = v_new_balance,
             total_credits_spent = total_credits_spent + v_total_cost,
-            total_songs_downloaded = total_songs_downloaded + p_songs_count
+            total_songs_downloaded = total_songs_downloaded + p_songs_count,
+            transaction_count = transaction_count + 1
         WHERE id = p_user_id;
 
         -- Record transaction
@@ -72,14 +79,6 @@ BEGIN
         -- Get the transaction ID
         SET v_transaction_id = LAST_INSERT_ID();
 
-        -- Check if user originally paid with e9th tokens
-        -- (Check if user has any e9th deposits that haven't been fully used)
-        SELECT COUNT(*) > 0 INTO v_user_paid_with_e9th
-        FROM e9th_deposits
-        WHERE user_id = p_user_id 
-        AND status = 'confirmed'
-        AND utility_tokens_issued > 0;
-
         -- If user paid with e9th tokens, collect equivalent e9th tokens
         -- 1 credit = 1 e9th token (1:1 ratio)
         IF v_user_paid_with_e9th THEN
@@ -93,12 +92,26 @@ BEGIN
                 p_user_id, v_transaction_id, v_total_cost, v_e9th_tokens_collected,
                 p_job_id, p_songs_count, 'collected'
             );
+
+            -- Running pending total, sharded into 16 slots by user so
+            -- concurrent deductions rarely contend on the same row
+            INSERT INTO e9th_pending_totals (slot, pending_tokens, pending_count)
+            VALUES (p_user_id % 16, v_e9th_tokens_collected, 1)
+            ON DUPLICATE KEY UPDATE
+                pending_tokens = pending_tokens + VALUES(pending_tokens),
+                pending_count = pending_count + 1;
+
+            -- The daily collection rollup is rebuilt by refresh_e9th_collection_daily
+            -- (scheduled), keeping it out of this user-row lock
         END IF;
 
         COMMIT;
         SET p_success = TRUE;
         SET p_error_message = NULL;
     END IF;
+
+    -- Status row so callers get the result in the same round trip as the CALL
+    SELECT p_success AS success, p_error_message AS error_message, v_new_balance AS new_balance;
 END //
 
 -- Procedure to process e9th token deposit and issue credits
@@ -127,6 +140,8 @@ BEGIN
         SET p_success = FALSE;
         SET p_error_message = 'Database error occurred';
         SET p_credits_issued = 0;
+        SELECT p_success AS success, p_error_message AS error_message,
+               p_credits_issued AS credits_issued, NULL AS new_balance;
     END;
 
     START TRANSACTION;
@@ -162,10 +177,13 @@ BEGIN
 
         SET v_deposit_id = LAST_INSERT_ID();
 
-        -- Add base credits
+        -- Add base credits and flag the user as e9th-funded
+        -- (read by deduct_credits instead of scanning e9th_deposits)
         UPDATE users
         SET credit_balance = credit_balance + v_base_credits,
-            total_credits_purchased = total_credits_purchased + v_base_credits
+            total_credits_purchased = total_credits_purchased + v_base_credits,
+            transaction_count = transaction_count + 1,
+            has_e9th_funding = (has_e9th_funding OR v_total_credits > 0)
         WHERE id = p_user_id;
 
         SELECT credit_balance INTO v_new_balance
@@ -183,7 +201,8 @@ BEGIN
         -- Add bonus credits if applicable
         IF v_bonus_credits > 0 THEN
             UPDATE users
-            SET credit_balance = credit_balance + v_bonus_credits
+            SET credit_balance = credit_balance + v_bonus_credits,
+                transaction_count = transaction_count + 1
             WHERE id = p_user_id;
 
             SELECT credit_balance INTO v_new_balance
@@ -208,21 +227,188 @@ BEGIN
         SET p_error_message = NULL;
         SET p_credits_issued = v_total_credits;
     END IF;
+
+    -- Status row so callers get the result in the same round trip as the CALL
+    SELECT p_success AS success, p_error_message AS error_message,
+           p_credits_issued AS credits_issued, v_new_balance AS new_balance;
 END //
 
--- Procedure to transfer collected e9th tokens to receiving wallet
-DROP PROCEDURE IF EXISTS transfer_collected_e9th //
-CREATE PROCEDURE transfer_collected_e9th(
+-- Procedure to add credits (purchase + package bonus + E9th direct payment bonus)
+-- Supersedes the version in migration_e9th_direct_bonus.sql
+DROP PROCEDURE IF EXISTS add_credits //
+CREATE PROCEDURE add_credits(
+    IN p_user_id INT,
+    IN p_package_id INT,
+    IN p_payment_method VARCHAR(50),
+    IN p_tx_hash VARCHAR(255),
+    OUT p_success BOOLEAN,
+    OUT p_error_message VARCHAR(255)
+)
+BEGIN
+    DECLARE v_base_credits DECIMAL(10, 2);
+    DECLARE v_bonus_credits DECIMAL(10, 2);
+    DECLARE v_total_credits DECIMAL(10, 2);
+    DECLARE v_e9th_direct_bonus DECIMAL(10, 2);
+    DECLARE v_e9th_bonus_percentage DECIMAL(10, 4);
+    DECLARE v_usd_amount DECIMAL(10, 2);
+    DECLARE v_new_balance DECIMAL(10, 2);
+    DECLARE v_is_e9th_direct BOOLEAN;
+    DECLARE v_already_credited INT DEFAULT 0;
+
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        SET p_success = FALSE;
+        SET p_error_message = 'Database error occurred';
+        SELECT p_success AS success, p_error_message AS error_message, NULL AS new_balance;
+    END;
+
+    START TRANSACTION;
+
+    -- Lock the user row first so concurrent calls for the same payment
+    -- (e.g. two webhook consumers) run one after the other
+    SELECT credit_balance INTO v_new_balance
+    FROM users WHERE id = p_user_id
+    FOR UPDATE;
+
+    -- Skip payments that were already credited; a locking read sees rows
+    -- committed by the call that held the lock before us
+    IF p_tx_hash IS NOT NULL THEN
+        SELECT COUNT(*) INTO v_already_credited
+        FROM credit_transactions
+        WHERE e9th_tx_hash = p_tx_hash
+          AND user_id = p_user_id
+          AND transaction_type = 'purchase'
+        LOCK IN SHARE MODE;
+    END IF;
+
+    -- Get package details
+    SELECT base_credits, bonus_credits, total_credits, usd_amount
+    INTO v_base_credits, v_bonus_credits, v_total_credits, v_usd_amount
+    FROM credit_packages
+    WHERE id = p_package_id AND is_active = TRUE;
+
+    IF v_already_credited > 0 THEN
+        COMMIT;
+        SET p_success = TRUE;
+        SET p_error_message = 'Already credited';
+    ELSEIF v_total_credits IS NULL THEN
+        ROLLBACK;
+        SET p_success = FALSE;
+        SET p_error_message = 'Invalid package';
+    ELSE
+        -- Check if payment method is E9th direct
+        SET v_is_e9th_direct = (p_payment_method = 'e9th_stablecoin' OR p_payment_method = 'e9th_direct');
+
+        -- Calculate E9th direct payment bonus (25% of base credits)
+        IF v_is_e9th_direct THEN
+            -- Get E9th direct bonus percentage from config
+            SELECT config_value INTO v_e9th_bonus_percentage
+            FROM pricing_config
+            WHERE config_key = 'e9th_direct_bonus_percentage';
+
+            SET v_e9th_direct_bonus = v_base_credits * v_e9th_bonus_percentage;
+        ELSE
+            SET v_e9th_direct_bonus = 0.00;
+        END IF;
+
+        -- Add base credits
+        UPDATE users
+        SET credit_balance = credit_balance + v_base_credits,
+            total_credits_purchased = total_credits_purchased + v_base_credits,
+            transaction_count = transaction_count + 1
+        WHERE id = p_user_id;
+
+        SELECT credit_balance INTO v_new_balance
+        FROM users WHERE id = p_user_id;
+
+        INSERT INTO credit_transactions (
+            user_id, transaction_type, amount, balance_after,
+            package_id, usd_amount, payment_method, e9th_tx_hash,
+            is_e9th_direct_payment, e9th_direct_bonus
+        ) VALUES (
+            p_user_id, 'purchase', v_base_credits, v_new_balance,
+            p_package_id, v_usd_amount, p_payment_method, p_tx_hash,
+            v_is_e9th_direct, v_e9th_direct_bonus
+        );
+
+        -- E9th direct payment rollup (backs the e9th_direct_payment_stats view)
+        IF v_is_e9th_direct THEN
+            INSERT INTO e9th_direct_payment_totals (slot, total_payments, total_amount, total_bonuses)
+            VALUES (p_user_id % 16, 1, v_base_credits, v_e9th_direct_bonus)
+            ON DUPLICATE KEY UPDATE
+                total_payments = total_payments + 1,
+                total_amount = total_amount + VALUES(total_amount),
+                total_bonuses = total_bonuses + VALUES(total_bonuses);
+        END IF;
+
+        -- Add package bonus credits if applicable
+        IF v_bonus_credits > 0 THEN
+            UPDATE users
+            SET credit_balance = credit_balance + v_bonus_credits,
+                transaction_count = transaction_count + 1
+            WHERE id = p_user_id;
+
+            SELECT credit_balance INTO v_new_balance
+            FROM users WHERE id = p_user_id;
+
+            INSERT INTO credit_transactions (
+                user_id, transaction_type, amount, balance_after,
+                package_id, notes
+            ) VALUES (
+                p_user_id, 'bonus', v_bonus_credits, v_new_balance,
+                p_package_id, CONCAT('Package bonus credits')
+            );
+        END IF;
+
+        -- Add E9th direct payment bonus if applicable
+        IF v_e9th_direct_bonus > 0 THEN
+            UPDATE users
+            SET credit_balance = credit_balance + v_e9th_direct_bonus,
+                total_credits_purchased = total_credits_purchased + v_e9th_direct_bonus,
+                transaction_count = transaction_count + 1
+            WHERE id = p_user_id;
+
+            SELECT credit_balance INTO v_new_balance
+            FROM users WHERE id = p_user_id;
+
+            INSERT INTO credit_transactions (
+                user_id, transaction_type, amount, balance_after,
+                package_id, notes, e9th_direct_bonus
+            ) VALUES (
+                p_user_id, 'bonus', v_e9th_direct_bonus, v_new_balance,
+                p_package_id, CONCAT('E9th direct payment bonus (25%)'), v_e9th_direct_bonus
+            );
+        END IF;
+
+        COMMIT;
+        SET p_success = TRUE;
+        SET p_error_message = NULL;
+    END IF;
+
+    -- Status row so callers get the result in the same round trip as the CALL
+    SELECT p_success AS success, p_error_message AS error_message, v_new_balance AS new_balance;
+END //
+
+-- Procedure to transfer a bounded chunk of collected e9th tokens
+-- Claims the oldest 'collected' rows by id (at most p_max_collections;
+-- NULL = no limit), so each call locks and updates a bounded set of rows
+-- and concurrent deduct_credits inserts of newer rows are not blocked.
+DROP PROCEDURE IF EXISTS transfer_collected_e9th_chunk //
+CREATE PROCEDURE transfer_collected_e9th_chunk(
     IN p_receiving_wallet_id INT,
+    IN p_max_collections INT,
     OUT p_success BOOLEAN,
     OUT p_error_message VARCHAR(255),
     OUT p_transfer_id INT,
     OUT p_total_transferred DECIMAL(18, 8)
 )
 BEGIN
-    DECLARE v_total_tokens DECIMAL(18, 8);
-    DECLARE v_collection_count INT;
+    DECLARE v_total_tokens DECIMAL(18, 8) DEFAULT 0;
+    DECLARE v_collection_count INT DEFAULT 0;
     DECLARE v_wallet_address VARCHAR(100);
+    DECLARE v_limit INT;
+    DECLARE v_last_id INT;
 
     DECLARE EXIT HANDLER FOR SQLEXCEPTION
     BEGIN
@@ -231,8 +417,14 @@ BEGIN
         SET p_error_message = 'Database error occurred';
         SET p_transfer_id = NULL;
         SET p_total_transferred = 0;
+        SELECT p_success AS success, p_error_message AS error_message,
+               p_transfer_id AS transfer_id, p_total_transferred AS total_transferred,
+               0 AS collection_count, NULL AS remaining_tokens, NULL AS remaining_count,
+               NULL AS wallet_address, NULL AS wallet_name;
     END;
 
+    SET v_limit = COALESCE(p_max_collections, 2147483647);
+
     START TRANSACTION;
 
     -- Get receiving wallet address
@@ -247,13 +439,27 @@ BEGIN
         SET p_transfer_id = NULL;
         SET p_total_transferred = 0;
     ELSE
-        -- Calculate total tokens to transfer (all collected tokens)
-        SELECT 
-            COALESCE(SUM(e9th_tokens_collected), 0),
-            COUNT(*)
-        INTO v_total_tokens, v_collection_count
-        FROM e9th_collections
-        WHERE collection_status = 'collected';
+        -- Upper id bound of this chunk (walks idx_status_id)
+        SELECT MAX(id) INTO v_last_id
+        FROM (
+            SELECT id
+            FROM e9th_collections
+            WHERE collection_status = 'collected'
+            ORDER BY id
+            LIMIT v_limit
+        ) AS chunk;
+
+        -- Lock and total the chunk
+        IF v_last_id IS NOT NULL THEN
+            SELECT
+                COALESCE(SUM(e9th_tokens_collected), 0),
+                COUNT(*)
+            INTO v_total_tokens, v_collection_count
+            FROM e9th_collections
+            WHERE collection_status = 'collected'
+            AND id <= v_last_id
+            FOR UPDATE;
+        END IF;
 
         IF v_total_tokens <= 0 THEN
             ROLLBACK;
@@ -277,7 +483,21 @@ BEGIN
             UPDATE e9th_collections
             SET collection_status = 'transferred',
                 transfer_id = p_transfer_id
-            WHERE collection_status = 'collected';
+            WHERE collection_status = 'collected'
+            AND id <= v_last_id;
+
+            -- Take the chunk out of the running pending totals
+            UPDATE e9th_pending_totals t
+            JOIN (
+                SELECT user_id % 16 AS slot,
+                       SUM(e9th_tokens_collected) AS tokens,
+                       COUNT(*) AS collections
+                FROM e9th_collections
+                WHERE transfer_id = p_transfer_id
+                GROUP BY user_id % 16
+            ) moved ON moved.slot = t.slot
+            SET t.pending_tokens = t.pending_tokens - moved.tokens,
+                t.pending_count = t.pending_count - moved.collections;
 
             COMMIT;
             SET p_success = TRUE;
@@ -285,6 +505,32 @@ BEGIN
             SET p_total_transferred = v_total_tokens;
         END IF;
     END IF;
+
+    -- Status row so callers get the result in the same round trip as the CALL
+    SELECT p_success AS success, p_error_message AS error_message,
+           p_transfer_id AS transfer_id, p_total_transferred AS total_transferred,
+           v_collection_count AS collection_count,
+           (SELECT COALESCE(SUM(pending_tokens), 0) FROM e9th_pending_totals) AS remaining_tokens,
+           (SELECT COALESCE(SUM(pending_count), 0) FROM e9th_pending_totals) AS remaining_count,
+           v_wallet_address AS wallet_address,
+           (SELECT wallet_name FROM e9th_receiving_wallets WHERE id = p_receiving_wallet_id) AS wallet_name;
+END //
+
+-- Procedure to transfer all collected e9th tokens to receiving wallet
+-- (single unbounded chunk; prefer transfer_collected_e9th_chunk for large backlogs)
+DROP PROCEDURE IF EXISTS transfer_collected_e9th //
+CREATE PROCEDURE transfer_collected_e9th(
+    IN p_receiving_wallet_id INT,
+    OUT p_success BOOLEAN,
+    OUT p_error_message VARCHAR(255),
+    OUT p_transfer_id INT,
+    OUT p_total_transferred DECIMAL(18, 8)
+)
+BEGIN
+    CALL transfer_collected_e9th_chunk(
+        p_receiving_wallet_id, NULL,
+        p_success, p_error_message, p_transfer_id, p_total_transferred
+    );
 END //
 
 DELIMITER ;
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measure cold import time and memory of the API module
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RUNS = int(os.getenv('MEASURE_RUNS', 5))
+
+# Runs in a fresh interpreter so every import is cold
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import api.app
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print(json.dumps({
+    'import_seconds': elapsed,
+    'peak_rss_mb': rss_kb / 1024,
+    'modules': len(sys.modules),
+    'selenium_loaded': 'selenium' in sys.modules,
+}))
+"""
+
+def measure_once():
+    """Import api.app in a child process and return its measurements"""
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def measure_startup():
+    """Report median cold import time and peak RSS over several runs"""
+
+    print("="*60)
+    print("API COLD IMPORT MEASUREMENT")
+    print("="*60)
+
+    runs = []
+    for i in range(RUNS):
+        sample = measure_once()
+        runs.append(sample)
+        print(f"  run {i + 1}: {sample['import_seconds'] * 1000:.1f} ms, "
+              f"{sample['peak_rss_mb']:.1f} MB RSS, {sample['modules']} modules")
+
+    times = sorted(r['import_seconds'] for r in runs)
+    rss = sorted(r['peak_rss_mb'] for r in runs)
+
+    print("\n" + "-"*60)
+    print(f"Median import time: {times[len(times) // 2] * 1000:.1f} ms")
+    print(f"Median peak RSS:    {rss[len(rss) // 2]:.1f} MB")
+    print(f"Selenium loaded:    {runs[-1]['selenium_loaded']}")
+    print("="*60)
+
+if __name__ == "__main__":
+    try:
+        measure_startup()
+    except subprocess.CalledProcessError as e:
+        print(f"\n✗ Import failed:\n{e.stderr}")
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler for hikeyz.com API requests and download jobs
+Writes collapsed stacks (flamegraph.pl / speedscope format)
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Shared by the API (request profiles) and the download worker (job profiles)
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/hikeyz-profiles')
+PROFILE_INTERVAL_MS = int(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 60))  # Per request
+PROFILE_JOB_MAX_SECONDS = int(os.getenv('PROFILE_JOB_MAX_SECONDS', 600))  # Per download job
+
+class SamplingProfiler:
+    """Samples one thread's stack on a timer from a background thread"""
+
+    def __init__(self, thread_id=None, interval=0.005, max_seconds=60):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_seconds = max_seconds  # Sampling stops after this, bounding overhead
+        self.samples = {}
+        self.sample_count = 0
+        self.started_at = None
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        """Start sampling the target thread"""
+        self.started_at = time.time()
+        self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self.sampler.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread"""
+        self.stopped.set()
+        if self.sampler:
+            self.sampler.join()
+
+    def _sample_loop(self):
+        deadline = self.started_at + self.max_seconds
+        while not self.stopped.wait(self.interval):
+            if time.time() >= deadline:
+                return
+
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            del frame
+
+            key = ';'.join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    def collapsed(self):
+        """Return the profile as collapsed stack lines: 'a;b;c count'"""
+        return '\n'.join(f"{stack} {count}" for stack, count in sorted(self.samples.items()))
+
+    def save(self, directory, name):
+        """Stop sampling and write the profile; returns the file path"""
+        self.stop()
+        os.makedirs(directory, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)[:100]
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{safe_name}.collapsed"
+        path = os.path.join(directory, filename)
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+            f.write('\n')
+        return path
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+HMAC-signed, expiring URLs for downloadable artifacts
+Stateless: any process holding the secret can issue or check a URL
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from urllib.parse import quote
+
+def sign_path(secret, path, expires):
+    """Signature for a path (relative to the download root) valid until `expires` (unix time)"""
+    message = f"{path}\n{int(expires)}".encode('utf-8')
+    digest = hmac.new(secret.encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode('ascii')
+
+def build_signed_url(base_url, secret, path, ttl_seconds, now=None):
+    """Absolute URL for `path` under base_url, with expires and sig query parameters"""
+    expires = int((now or time.time()) + ttl_seconds)
+    signature = sign_path(secret, path, expires)
+    return f"{base_url.rstrip('/')}/{quote(path)}?expires={expires}&sig={signature}"
+
+def verify_signed_path(secret, path, expires, signature, now=None):
+    """True if the signature matches the path and has not expired"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < (now or time.time()):
+        return False
+    # Bytes, so a tampered non-ASCII signature fails instead of raising TypeError
+    return hmac.compare_digest(sign_path(secret, path, expires).encode('utf-8'),
+                               (signature or '').encode('utf-8'))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Per-account cache of SUNO song lists for hikeyz.com download workers
+One JSON file per account, so every worker process on the host shares it
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import time
+
+SONG_LIST_CACHE_DIR = os.getenv('SONG_LIST_CACHE_DIR', '/tmp/hikeyz-song-lists')
+SONG_LIST_CACHE_TTL_SECONDS = int(os.getenv('SONG_LIST_CACHE_TTL_SECONDS', 900))  # 0 disables the cache
+# Past the TTL (and up to this age), only the head of the list is re-read and merged
+SONG_LIST_HEAD_REFRESH_MAX_AGE_SECONDS = int(os.getenv('SONG_LIST_HEAD_REFRESH_MAX_AGE_SECONDS', 86400))
+
+def song_list_key(account_id):
+    """
+    Cache key for a SUNO account id; the id must come from the logged-in
+    browser, never from request input
+    """
+    return hashlib.sha256(account_id.encode('utf-8')).hexdigest()[:32]
+
+def load_song_list(key):
+    """Cached entry ({'songs', 'complete', 'saved_at'}) plus its age in seconds, or (None, None)"""
+    if SONG_LIST_CACHE_TTL_SECONDS <= 0:
+        return None, None
+    try:
+        with open(os.path.join(SONG_LIST_CACHE_DIR, f"{key}.json")) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    return entry, time.time() - entry.get('saved_at', 0)
+
+def save_song_list(key, songs, complete):
+    """Store a song list; complete means discovery reached the end of the profile"""
+    if SONG_LIST_CACHE_TTL_SECONDS <= 0:
+        return
+    os.makedirs(SONG_LIST_CACHE_DIR, exist_ok=True)
+    path = os.path.join(SONG_LIST_CACHE_DIR, f"{key}.json")
+    partial_path = f"{path}.{secrets.token_hex(4)}.part"
+    with open(partial_path, 'w') as f:
+        json.dump({'songs': songs, 'complete': complete, 'saved_at': time.time()}, f)
+    os.replace(partial_path, path)
+
+def covers(entry, max_songs):
+    """True if the cached list can serve a job for max_songs songs"""
+    return entry['complete'] or len(entry['songs']) >= max_songs
+
+def merge_head(head, cached):
+    """
+    Newest songs from a head refresh, followed by the cached songs not among
+    them; None if the head never reached a cached song (nothing to join onto)
+    """
+    seen = {song['id'] for song in head}
+    if not any(song['id'] in seen for song in cached):
+        return None
+    return head + [song for song in cached if song['id'] not in seen]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Structured logging for hikeyz.com API and workers
+JSON lines written by a background thread so callers never block on stdout
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', '')  # Empty: write to stdout
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Records beyond this are dropped, not waited on
+LOG_SONG_SAMPLE_EVERY = int(os.getenv('LOG_SONG_SAMPLE_EVERY', 10))  # Per-song INFO line every N songs
+
+# Fields added to every record logged from the current thread/context (job_id, user_id, ...)
+log_context = contextvars.ContextVar('log_context', default={})
+
+logging_state = {'listener': None, 'handler': None, 'dropped': 0}
+logging_lock = threading.Lock()
+
+def bind_log_context(**fields):
+    """Add fields to the current log context; returns a token for reset_log_context"""
+    context = dict(log_context.get())
+    context.update(fields)
+    return log_context.set(context)
+
+def reset_log_context(token):
+    """Restore the log context from before bind_log_context"""
+    log_context.reset(token)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, context and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the writer falls behind"""
+
+    def prepare(self, record):
+        # Resolve everything that depends on the caller before crossing threads
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.context = log_context.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            logging_state['dropped'] += 1
+
+def start_log_writer():
+    """Create the queue, writer thread and handler (called at setup and after fork)"""
+    if LOG_FILE:
+        output = logging.FileHandler(LOG_FILE)
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = QueueListener(records, output, respect_handler_level=False)
+    listener.start()
+
+    root = logging.getLogger('hikeyz')
+    if logging_state['handler'] is not None:
+        root.removeHandler(logging_state['handler'])
+    handler = NonBlockingQueueHandler(records)
+    root.addHandler(handler)
+
+    logging_state['listener'] = listener
+    logging_state['handler'] = handler
+
+def stop_log_writer():
+    """Flush queued records and stop the writer thread"""
+    listener = logging_state['listener']
+    if listener is not None:
+        logging_state['listener'] = None
+        listener.stop()
+
+def configure_logging():
+    """Set up the 'hikeyz' logger once per process"""
+    with logging_lock:
+        if logging_state['handler'] is not None:
+            return
+
+        root = logging.getLogger('hikeyz')
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.propagate = False
+        start_log_writer()
+
+        atexit.register(stop_log_writer)
+        # The writer thread does not survive fork (gunicorn --preload); restart it in the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=start_log_writer)
+
+def get_logger(name):
+    """Return a logger under 'hikeyz'; log.info(msg, extra={'fields': {...}}) adds JSON fields"""
+    configure_logging()
+    return logging.getLogger(f'hikeyz.{name}')
+
+def dropped_log_records():
+    """Number of records dropped because the queue was full"""
+    return logging_state['dropped']
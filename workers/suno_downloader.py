@@ -6,13 +6,22 @@ Integrates with the SaaS backend API
 
 import time
 import os
+import base64
 import re
 import json
+import logging
 import requests
+import socket
+import threading
 import zipfile
 from selenium import webdriver
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import StaleElementReferenceException
 from datetime import datetime
+from structured_log import get_logger, bind_log_context, LOG_SONG_SAMPLE_EVERY
+from sampling_profiler import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_JOB_MAX_SECONDS
+from song_list_cache import (song_list_key, load_song_list, save_song_list, covers, merge_head,
+                             SONG_LIST_CACHE_TTL_SECONDS, SONG_LIST_HEAD_REFRESH_MAX_AGE_SECONDS)
 
 # Suppress warnings
 import warnings
@@ -20,15 +29,35 @@ warnings.filterwarnings("ignore")
 import urllib3
 urllib3.disable_warnings()
 
+# Where songs, ZIPs and progress files are written
+DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR', '/Users/Morpheous/vltrndataroom/hitbot-agency/downloads')
+
+# Pacing (seconds): wait for SUNO page loads/scrolls, and delay between CDN downloads
+PAGE_LOAD_WAIT_SECONDS = float(os.getenv('PAGE_LOAD_WAIT_SECONDS', 5))
+SCROLL_WAIT_SECONDS = float(os.getenv('SCROLL_WAIT_SECONDS', 2))
+SONG_DELAY_SECONDS = float(os.getenv('SONG_DELAY_SECONDS', 1.5))
+
+# Per-song failures logged individually per job; the rest only count toward the summary
+LOG_SONG_FAILURES = int(os.getenv('LOG_SONG_FAILURES', 5))
+
+log = get_logger('worker')
+
+class JobAborted(Exception):
+    """Raised inside a job once abort() has been called (e.g. by the API watchdog)"""
+
 class SUNODownloader:
     """Worker class for downloading SUNO songs"""
 
-    def __init__(self, job_id, session_token, credentials, max_songs=20):
+    def __init__(self, job_id, session_token, credentials, max_songs=20, progress_callback=None,
+                 song_metrics_callback=None, profile_dir=None):
         self.job_id = job_id
         self.session_token = session_token
         self.credentials = credentials
         self.max_songs = max_songs
-        self.download_dir = f"/Users/Morpheous/vltrndataroom/hitbot-agency/downloads/{job_id}/"
+        self.progress_callback = progress_callback  # Called with a copy of progress on every update
+        self.song_metrics_callback = song_metrics_callback  # Called with (seconds, bytes, success) per song
+        self.profile_dir = profile_dir  # If set, run() is sampled and the profile saved here
+        self.download_dir = os.path.join(DOWNLOAD_DIR, job_id, '')
         self.progress = {
             'status': 'pending',
             'total_songs': 0,
@@ -37,6 +66,11 @@ class SUNODownloader:
             'current_song': None,
             'error_message': None
         }
+        self.song_stats = {'bytes': 0, 'seconds': 0.0, 'failures_logged': 0}  # Aggregated per-song detail
+        self.driver = None  # Only connected when the song list is not served from cache
+        self.response = None  # CDN stream currently being read
+        self.heartbeat = {'at': time.monotonic(), 'bytes': 0}  # Last sign of progress, bytes moved so far
+        self.abort_reason = None
 
         # Create download directory
         os.makedirs(self.download_dir, exist_ok=True)
@@ -56,74 +90,150 @@ class SUNODownloader:
         """Construct direct CDN URL for song"""
         return f"https://cdn1.suno.ai/{song_id}.mp3"
 
+    def beat(self, bytes_moved=0):
+        """Record progress for the watchdog"""
+        self.heartbeat['bytes'] += bytes_moved
+        self.heartbeat['at'] = time.monotonic()
+
+    def abort(self, reason):
+        """
+        Stop a stalled or runaway job from another thread: the CDN stream is
+        closed, the browser quit, and the job raises JobAborted at its next check.
+        An aborted job no longer reports progress.
+        """
+        self.abort_reason = reason
+
+        response = self.response
+        if response is not None:
+            # Shut the socket down rather than close() the response: close()
+            # waits for the read it is meant to interrupt
+            connection = getattr(response.raw, '_connection', None)
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError as e:
+                    log.warning(f"Closing CDN stream failed: {e}")
+
+        driver = self.driver
+        if driver is not None:
+            # quit() can block on a hung browser; don't hold up the caller
+            threading.Thread(target=self._quit_driver, args=(driver,), daemon=True).start()
+
+    def _quit_driver(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            log.warning(f"Quitting browser failed: {e}")
+
+    def check_aborted(self):
+        """Raise JobAborted if abort() was called"""
+        if self.abort_reason:
+            raise JobAborted(self.abort_reason)
+
     def update_progress(self, **kwargs):
         """Update progress and save to file"""
         self.progress.update(kwargs)
+        if self.abort_reason:
+            return
+        self.beat()
 
         # Save progress to file for API to read
-        progress_file = f"/Users/Morpheous/vltrndataroom/hitbot-agency/downloads/{self.job_id}_progress.json"
+        progress_file = os.path.join(DOWNLOAD_DIR, f"{self.job_id}_progress.json")
         with open(progress_file, 'w') as f:
             json.dump(self.progress, f, indent=2)
 
+        # Push the update to in-process listeners (API progress stream)
+        if self.progress_callback:
+            try:
+                self.progress_callback(dict(self.progress))
+            except Exception as e:
+                log.error(f"Progress callback error: {e}")
+
     def connect_to_chrome(self):
         """Connect to Chrome with debugging port"""
-        print("Connecting to Chrome...")
+        log.info("Connecting to Chrome...")
         options = webdriver.ChromeOptions()
         options.add_experimental_option('debuggerAddress', 'localhost:9222')
 
         try:
             driver = webdriver.Chrome(options=options)
-            print(f"Connected! Current page: {driver.current_url}")
+            log.info(f"Connected! Current page: {driver.current_url}")
             return driver
         except Exception as e:
             raise Exception(f"Failed to connect to Chrome: {e}")
 
-    def load_songs(self, driver):
-        """Load and extract song URLs from SUNO profile"""
-        print("Navigating to SUNO profile...")
+    def load_songs(self, driver, known_ids=None):
+        """
+        Load and extract song URLs from SUNO profile
+        (with known_ids, stop scrolling once the page reaches an already known song)
+        """
+        log.info("Navigating to SUNO profile...")
 
         # Navigate to SUNO
         if 'suno.com/me' not in driver.current_url:
             driver.get('https://suno.com/me')
-            time.sleep(5)
+            time.sleep(PAGE_LOAD_WAIT_SECONDS)
 
         # Count initial songs
         initial_songs = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/song/"]')
-        print(f"Initial songs loaded: {len(initial_songs)}")
+        log.info(f"Initial songs loaded: {len(initial_songs)}")
+
+        def reached_known(elements):
+            for elem in elements:
+                try:
+                    href = elem.get_attribute('href')
+                except StaleElementReferenceException:
+                    continue  # Re-rendered while the page scrolled
+                if href and self.extract_song_id(href) in known_ids:
+                    return True
+            return False
 
         # Improved scrolling
-        print("Loading more songs...")
+        log.info("Loading more songs...")
         last_count = len(initial_songs)
         no_change_count = 0
         scroll_count = 0
         max_scrolls = 20
 
+        if known_ids and reached_known(initial_songs):
+            max_scrolls = 0
+
         while scroll_count < max_scrolls:
             scroll_count += 1
+            self.check_aborted()
+            self.beat()
 
             # Scroll down
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
+            time.sleep(SCROLL_WAIT_SECONDS)
 
             # Count unique songs
             song_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/song/"]')
             unique_urls = set()
             for elem in song_elements:
-                href = elem.get_attribute('href')
+                try:
+                    href = elem.get_attribute('href')
+                except StaleElementReferenceException:
+                    continue
                 if href:
                     base_href = href.split('?')[0]
                     unique_urls.add(base_href)
 
             current_count = len(unique_urls)
 
+            if known_ids and reached_known(song_elements):
+                log.info(f"Reached cached songs after {scroll_count} scrolls")
+                break
+
             if current_count >= self.max_songs:
-                print(f"Reached target: {current_count} songs")
+                log.info(f"Reached target: {current_count} songs")
                 break
 
             if current_count == last_count:
                 no_change_count += 1
                 if no_change_count >= 5:
-                    print(f"No new songs after 5 scrolls. Total: {current_count}")
+                    log.info(f"No new songs after 5 scrolls. Total: {current_count}")
                     break
             else:
                 no_change_count = 0
@@ -163,7 +273,68 @@ class SUNODownloader:
                 continue
 
         song_data = list(unique_songs.values())
-        print(f"Extracted {len(song_data)} unique songs")
+        log.info(f"Extracted {len(song_data)} unique songs")
+
+        return song_data
+
+    def logged_in_account(self, driver):
+        """
+        SUNO user id of the account the browser is logged into, read from its
+        Clerk session cookie (None if there is no session)
+        """
+        try:
+            cookies = driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+            for cookie in cookies:
+                if cookie.get('name') == '__session' and cookie.get('domain', '').endswith('suno.com'):
+                    payload = cookie['value'].split('.')[1]
+                    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+                    return claims.get('sub')
+        except Exception as e:
+            log.warning(f"Could not read the SUNO account from the browser: {e}")
+        return None
+
+    def discover_songs(self):
+        """
+        Song list for this job: the account's cached list while fresh, otherwise
+        read from the SUNO profile (only its head when the cached list is recent).
+        The cache is keyed by the account the browser is logged into.
+        """
+        self.update_progress(current_song='Connecting to browser')
+        self.driver = self.connect_to_chrome()
+        self.check_aborted()  # Aborted while connecting: abort() had no driver to quit
+
+        account_id = self.logged_in_account(self.driver)
+        key = song_list_key(account_id) if account_id else None
+        entry, age = load_song_list(key) if key else (None, None)
+        usable = entry is not None and covers(entry, self.max_songs)
+
+        if usable and age <= SONG_LIST_CACHE_TTL_SECONDS:
+            log.info(f"Song list from cache: {len(entry['songs'])} songs ({age:.0f}s old)")
+            return entry['songs']
+
+        self.update_progress(current_song='Loading song list')
+
+        song_data = None
+        if usable and age <= SONG_LIST_HEAD_REFRESH_MAX_AGE_SECONDS:
+            head = self.load_songs(self.driver, known_ids={song['id'] for song in entry['songs']})
+            song_data = merge_head(head, entry['songs'])
+            if song_data is not None:
+                complete = entry['complete']
+                log.info(f"Song list head refreshed: {len(song_data) - len(entry['songs'])} new songs")
+            else:
+                # load_songs only stops early at a cached song, so this was a full scroll
+                log.info("Head refresh never reached a cached song; using it as a full discovery")
+                song_data = head
+                complete = len(song_data) < self.max_songs
+        else:
+            song_data = self.load_songs(self.driver)
+            complete = len(song_data) < self.max_songs  # Discovery ran out of songs before the target
+
+        if key:
+            try:
+                save_song_list(key, song_data, complete)
+            except OSError as e:
+                log.warning(f"Song list cache write failed: {e}")
 
         return song_data
 
@@ -173,45 +344,77 @@ class SUNODownloader:
         title = song['title']
         cdn_url = song['cdn_url']
 
-        print(f"\nSong {index}/{total}: {title}")
         self.update_progress(current_song=title)
 
+        started = time.perf_counter()
+        success, error, bytes_downloaded = self._fetch_song(song_id, title, cdn_url, index)
+        elapsed = time.perf_counter() - started
+
+        self.song_stats['bytes'] += bytes_downloaded
+        self.song_stats['seconds'] += elapsed
+        if success:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"Song {index}/{total} downloaded: {title}",
+                          extra={'fields': {'song_id': song_id, 'bytes': bytes_downloaded, 'seconds': round(elapsed, 3)}})
+        elif self.song_stats['failures_logged'] < LOG_SONG_FAILURES:
+            self.song_stats['failures_logged'] += 1
+            log.warning(f"Song {index}/{total} failed: {title}: {error}", extra={'fields': {'song_id': song_id}})
+
+        if self.song_metrics_callback:
+            try:
+                self.song_metrics_callback(elapsed, bytes_downloaded, success)
+            except Exception as e:
+                log.error(f"Song metrics callback error: {e}")
+
+        return success, error
+
+    def _fetch_song(self, song_id, title, cdn_url, index):
+        """Stream one song from the CDN; returns (success, error, bytes_downloaded)"""
+        bytes_downloaded = 0
+        partial_path = None
+        filename = f"{index:03d}_{title}_{song_id[:8]}.mp3"
+        filepath = os.path.join(self.download_dir, filename)
+        if os.path.exists(filepath):
+            # Finished by an earlier attempt at this job (requeued by the watchdog)
+            return True, None, 0
+
         try:
             # Download from CDN
-            response = requests.get(cdn_url, stream=True, timeout=30)
+            response = self.response = requests.get(cdn_url, stream=True, timeout=30)
 
             if response.status_code == 200:
-                # Save file
-                filename = f"{index:03d}_{title}_{song_id[:8]}.mp3"
-                filepath = os.path.join(self.download_dir, filename)
+                # Save file (under a .part name until complete, so the API
+                # only ever lists finished songs)
+                partial_path = filepath + '.part'
 
-                with open(filepath, 'wb') as f:
+                with open(partial_path, 'wb') as f:
                     for chunk in response.iter_content(chunk_size=8192):
                         if chunk:
                             f.write(chunk)
+                            bytes_downloaded += len(chunk)
+                            self.beat(len(chunk))
 
                 # Verify file
-                if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                    size_mb = os.path.getsize(filepath) / (1024 * 1024)
-                    print(f"  ✓ Downloaded: {size_mb:.2f} MB")
-                    return True, None
+                if os.path.getsize(partial_path) > 0:
+                    os.replace(partial_path, filepath)
+                    return True, None, bytes_downloaded
                 else:
-                    print(f"  ✗ Failed: Empty file")
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                    return False, "Empty file"
+                    os.remove(partial_path)
+                    return False, "Empty file", bytes_downloaded
             else:
-                print(f"  ✗ Failed: HTTP {response.status_code}")
-                return False, f"HTTP {response.status_code}"
+                return False, f"HTTP {response.status_code}", bytes_downloaded
 
         except Exception as e:
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
             error_msg = str(e)[:100]
-            print(f"  ✗ Error: {error_msg}")
-            return False, error_msg
+            return False, error_msg, bytes_downloaded
+        finally:
+            self.response = None
 
     def create_zip(self):
         """Create ZIP file of all downloaded songs"""
-        print("\nCreating ZIP file...")
+        log.info("Creating ZIP file...")
 
         zip_filename = f"{self.job_id}_songs.zip"
         zip_path = os.path.join(self.download_dir, zip_filename)
@@ -223,29 +426,37 @@ class SUNODownloader:
                         file_path = os.path.join(root, file)
                         arcname = os.path.basename(file)
                         zipf.write(file_path, arcname)
+                        self.beat()
 
         if os.path.exists(zip_path):
             size_mb = os.path.getsize(zip_path) / (1024 * 1024)
-            print(f"ZIP created: {size_mb:.2f} MB")
+            log.info(f"ZIP created: {size_mb:.2f} MB")
             return zip_path
         else:
             raise Exception("Failed to create ZIP file")
 
     def run(self):
-        """Main download process"""
+        """Main download process (sampled by the profiler when profile_dir is set)"""
+        if not self.profile_dir:
+            return self._run()
+
+        from sampling_profiler import SamplingProfiler
+        profiler = SamplingProfiler(interval=PROFILE_INTERVAL_MS / 1000, max_seconds=PROFILE_JOB_MAX_SECONDS).start()
         try:
-            print("="*50)
-            print(f"SUNO DOWNLOADER - Job {self.job_id}")
-            print("="*50)
+            return self._run()
+        finally:
+            path = profiler.save(self.profile_dir, f"job-{self.job_id}")
+            log.info(f"Profile saved: {path} ({profiler.sample_count} samples)")
 
-            self.update_progress(status='processing', current_song='Connecting to browser')
+    def _run(self):
+        bind_log_context(job_id=self.job_id)
+        try:
+            log.info(f"SUNO DOWNLOADER - Job {self.job_id}")
 
-            # Connect to Chrome
-            driver = self.connect_to_chrome()
+            self.update_progress(status='processing', current_song='Loading song list')
 
-            # Load songs
-            self.update_progress(current_song='Loading song list')
-            song_data = self.load_songs(driver)
+            # Load songs (connects to Chrome unless the cached list is fresh)
+            song_data = self.discover_songs()
 
             # Limit to max_songs
             song_data = song_data[:self.max_songs]
@@ -256,15 +467,15 @@ class SUNODownloader:
             )
 
             # Download all songs
-            print(f"\n{'='*50}")
-            print(f"DOWNLOADING {len(song_data)} SONGS")
-            print(f"{'='*50}\n")
+            log.info(f"Downloading {len(song_data)} songs")
 
             downloaded = 0
             failed = 0
 
             for i, song in enumerate(song_data, 1):
+                self.check_aborted()
                 success, error = self.download_song(song, i, len(song_data))
+                self.check_aborted()
 
                 if success:
                     downloaded += 1
@@ -277,31 +488,37 @@ class SUNODownloader:
                     failed=failed
                 )
 
-                # Progress report
-                if i % 5 == 0:
+                # Progress report (sampled instead of a line per song)
+                if i % LOG_SONG_SAMPLE_EVERY == 0:
                     success_rate = (downloaded / i) * 100
-                    print(f"\n--- Progress: {downloaded}/{i} ({success_rate:.1f}% success) ---\n")
+                    log.info(f"Progress: {downloaded}/{i} ({success_rate:.1f}% success)",
+                             extra={'fields': {'downloaded': downloaded, 'failed': failed,
+                                               'bytes': self.song_stats['bytes']}})
 
                 # Rate limiting
-                time.sleep(1.5)
+                time.sleep(SONG_DELAY_SECONDS)
 
             # Close browser
-            driver.quit()
+            if self.driver:
+                self.driver.quit()
+                self.driver = None
 
             # Create ZIP
             self.update_progress(current_song='Creating ZIP file')
             zip_path = self.create_zip()
 
             # Final summary
-            print(f"\n{'='*50}")
-            print("DOWNLOAD COMPLETE")
-            print(f"{'='*50}")
-            print(f"Total songs: {len(song_data)}")
-            print(f"Successfully downloaded: {downloaded}")
-            print(f"Failed: {failed}")
-            print(f"Success rate: {(downloaded/len(song_data)*100):.1f}%")
-            print(f"ZIP file: {zip_path}")
-            print(f"{'='*50}\n")
+            log.info(
+                f"Download complete: {downloaded}/{len(song_data)} songs, {failed} failed",
+                extra={'fields': {
+                    'total_songs': len(song_data),
+                    'downloaded': downloaded,
+                    'failed': failed,
+                    'bytes': self.song_stats['bytes'],
+                    'download_seconds': round(self.song_stats['seconds'], 3),
+                    'zip_path': zip_path
+                }}
+            )
 
             # Update final status
             self.update_progress(
@@ -318,9 +535,17 @@ class SUNODownloader:
                 'zip_path': zip_path
             }
 
+        except JobAborted as e:
+            log.warning(f"Job aborted: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'aborted': True
+            }
+
         except Exception as e:
             error_msg = str(e)
-            print(f"\nFATAL ERROR: {error_msg}")
+            log.error(f"FATAL ERROR: {error_msg}")
 
             self.update_progress(
                 status='failed',
@@ -336,16 +561,19 @@ def main():
     """CLI entry point for testing"""
     import sys
 
-    if len(sys.argv) < 2:
-        print("Usage: python3 suno_downloader.py <job_id> [max_songs]")
+    args = [arg for arg in sys.argv[1:] if arg != '--profile']
+    profile_dir = PROFILE_DIR if '--profile' in sys.argv else None
+
+    if len(args) < 1:
+        print("Usage: python3 suno_downloader.py <job_id> [max_songs] [--profile]")
         sys.exit(1)
 
-    job_id = sys.argv[1]
-    max_songs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    job_id = args[0]
+    max_songs = int(args[1]) if len(args) > 1 else 20
     session_token = "test_session"
     credentials = {}
 
-    downloader = SUNODownloader(job_id, session_token, credentials, max_songs)
+    downloader = SUNODownloader(job_id, session_token, credentials, max_songs, profile_dir=profile_dir)
     result = downloader.run()
 
     print(f"\nResult: {json.dumps(result, indent=2)}")